@@ -0,0 +1,232 @@
+"""
+Headless benchmark of ChordComponent rings.
+
+Sweeps ring sizes and identifier space widths and measures, for every combination, the time it takes to build the ring,
+the average and percentile lookup path length, the lookup throughput and the memory allocated per node.
+Results are written as JSON or CSV, for example:
+
+    python chord/benchmark.py --sizes 64 256 1024 --bits 16 32 160 --lookups 2000 --format csv --output results.csv
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from adhoccomputing.Generics import *
+from chord_component import ChordComponent, RoutingModes, bootstrap_ring
+from component_registry import ComponentRegistry
+from latency import CoordinateLatency
+import metrics
+
+FIELDS = [
+    "size",
+    "bits",
+    "build",
+    "routing_mode",
+    "virtual_nodes",
+    "worker_threads",
+    "build_seconds",
+    "join_seconds_per_node",
+    "memory_bytes_per_node",
+    "lookups",
+    "failed_lookups",
+    "lookups_per_second",
+    "mean_hops",
+    "p50_hops",
+    "p99_hops",
+    "p50_latency",
+    "p99_latency",
+    "mean_simulated_latency",
+    "p50_simulated_latency",
+    "p99_simulated_latency",
+    "keys",
+    "key_count_variance",
+    "max_to_mean_keys",
+]
+
+
+def random_node_ids(rng, size, bits):
+    ids = set()
+    while len(ids) < size:
+        ids.add(rng.getrandbits(bits))
+    return sorted(ids)
+
+
+def shutdown(nodes):
+    for node in nodes:
+        node.exit_process()
+    ComponentRegistry().clear()
+
+
+def run_case(
+    size,
+    bits,
+    lookups,
+    build="bootstrap",
+    routing_mode=RoutingModes.ITERATIVE,
+    concurrency=1,
+    seed=0,
+    virtual_nodes=0,
+    keys=0,
+    latency_model=None,
+    pns_candidates=1,
+    prs_candidates=1,
+    coalesce_window=None,
+    worker_threads=1,
+):
+    """
+    Builds a ring of size nodes in a bits wide identifier space, runs lookups from random nodes and returns the measurements.
+    build is either "bootstrap" (bootstrap_ring) or "join" (one join() per node). Every node hosts virtual_nodes virtual nodes.
+    If keys is set, that many keys are stored and the spread of key counts over the nodes is reported.
+    latency_model is the LatencyModel of the simulated links, pns_candidates and prs_candidates turn on proximity
+    neighbour and route selection. coalesce_window turns on outbound message coalescing.
+    worker_threads is the number of threads every node handles messages with.
+    """
+    if size > 2**bits:
+        raise ValueError(f"A {bits} bit identifier space cannot hold {size} nodes")
+    rng = random.Random(seed)
+    registry = ComponentRegistry()
+    registry.clear()
+    registry.configure_id_space(bits)
+    registry.set_latency_model(latency_model)
+    params = {
+        "routing_mode": routing_mode,
+        "virtual_nodes": virtual_nodes,
+        "pns_candidates": pns_candidates,
+        "prs_candidates": prs_candidates,
+        "coalesce_window": coalesce_window,
+    }
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    nodes = [
+        ChordComponent("Node", node_id, configuration_parameters=params, num_worker_threads=worker_threads)
+        for node_id in random_node_ids(rng, size, bits)
+    ]
+    if build == "bootstrap":
+        bootstrap_ring(nodes)
+    else:
+        for node in nodes:
+            node.join()
+    build_seconds = time.perf_counter() - started
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for node in nodes:
+        node.metrics.reset()
+    work = [(rng.choice(nodes), rng.getrandbits(bits)) for _ in range(lookups)]
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(lambda item: item[0].lookup(item[1]), work))
+    else:
+        for node, key in work:
+            node.lookup(key)
+    lookup_seconds = time.perf_counter() - started
+
+    report = metrics.collect(nodes)["total"]
+    load = {"variance": None, "max_to_mean": None}
+    if keys:
+        nodes[0].put_many(f"key-{i}" for i in range(keys))
+        load = metrics.key_load(nodes)
+    shutdown(nodes)
+    return {
+        "size": size,
+        "bits": bits,
+        "build": build,
+        "routing_mode": RoutingModes(routing_mode).value,
+        "virtual_nodes": virtual_nodes,
+        "worker_threads": worker_threads,
+        "build_seconds": build_seconds,
+        "join_seconds_per_node": build_seconds / size,
+        "memory_bytes_per_node": allocated / size,
+        "lookups": report["lookups"],
+        "failed_lookups": report["counters"].get("failed_lookups", 0),
+        "lookups_per_second": lookups / lookup_seconds if lookup_seconds else None,
+        "mean_hops": report["mean_hops"],
+        "p50_hops": report["p50_hops"],
+        "p99_hops": report["p99_hops"],
+        "p50_latency": report["latency"]["p50"],
+        "p99_latency": report["latency"]["p99"],
+        "mean_simulated_latency": report["simulated_latency"]["mean"],
+        "p50_simulated_latency": report["simulated_latency"]["p50"],
+        "p99_simulated_latency": report["simulated_latency"]["p99"],
+        "keys": keys,
+        "key_count_variance": load["variance"],
+        "max_to_mean_keys": load["max_to_mean"],
+    }
+
+
+def run_sweep(sizes, bits, lookups, **options):
+    """
+    Runs run_case for every combination of ring size and identifier width, options are passed on to run_case.
+    """
+    results = []
+    for b in bits:
+        for size in sizes:
+            if size > 2**b:
+                continue
+            results.append(run_case(size, b, lookups, **options))
+    return results
+
+
+def write_results(results, fp, fmt="json", fields=FIELDS):
+    if fmt == "csv":
+        writer = csv.DictWriter(fp, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        json.dump(results, fp, indent=2)
+        fp.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ChordComponent rings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--bits", type=int, nargs="+", default=[7, 16, 32])
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--build", choices=["bootstrap", "join"], default="bootstrap")
+    parser.add_argument("--routing-mode", choices=[mode.value for mode in RoutingModes], default=RoutingModes.ITERATIVE.value)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--virtual-nodes", type=int, default=0, help="virtual nodes hosted by every node")
+    parser.add_argument("--keys", type=int, default=0, help="keys to store for the key load report")
+    parser.add_argument("--latency-model", choices=["none", "coordinates"], default="none")
+    parser.add_argument("--pns", type=int, default=1, help="candidates of proximity neighbour selection")
+    parser.add_argument("--prs", type=int, default=1, help="candidates of proximity route selection")
+    parser.add_argument("--coalesce-window", type=float, help="seconds to coalesce outbound messages for, off by default")
+    parser.add_argument("--worker-threads", type=int, default=1, help="message handling threads per node")
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", help="file to write the results to, standard output by default")
+    args = parser.parse_args(argv)
+
+    setAHCLogLevel(ERROR)
+    results = run_sweep(
+        args.sizes,
+        args.bits,
+        args.lookups,
+        build=args.build,
+        routing_mode=args.routing_mode,
+        concurrency=args.concurrency,
+        seed=args.seed,
+        virtual_nodes=args.virtual_nodes,
+        keys=args.keys,
+        latency_model=CoordinateLatency(seed=args.seed) if args.latency_model == "coordinates" else None,
+        pns_candidates=args.pns,
+        prs_candidates=args.prs,
+        coalesce_window=args.coalesce_window,
+        worker_threads=args.worker_threads,
+    )
+    if args.output:
+        with open(args.output, "w", newline="") as fp:
+            write_results(results, fp, args.format)
+    else:
+        write_results(results, sys.stdout, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,44 @@
+import itertools
+import math
+import random
+from array import array
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from operator import itemgetter
 from adhoccomputing.GenericModel import GenericModel
-import matplotlib.pyplot as plt
-from queue import Queue, Empty
 from component_registry import ComponentRegistry
+from metrics import NodeMetrics
+from storage import KeyValueStore
+from location_cache import LocationCache, LOCATION_CACHE_TTL
+from coalescing import OutboundCoalescer, COALESCE_MAX_MESSAGES
+import vectorized
+from maintenance import FingerSelection, StabilizationScheduler, FIX_FINGERS_INTERVAL
 from adhoccomputing.Generics import *
 from adhoccomputing.Experimentation.Topology import Topology
 
 total_nodes = 50
-SYSTEM_SIZE_BITS = 7
+# Default time in seconds to wait for a response, and how many times a request is resent before giving up.
+REQUEST_TIMEOUT = 0.1
+REQUEST_RETRIES = 0
+# A FIX_FINGERS_REQ is answered once the node refreshed all of its fingers, a lookup each
+FIX_FINGERS_TIMEOUT = 10.0
+# A KEY_TRANSFER_REQ is answered with a whole arc of keys, which may take longer than the request timeout
+KEY_TRANSFER_TIMEOUT = 5.0
+# Number of successors every node keeps, and how long in seconds a peer that failed stays suspected
+SUCCESSOR_LIST_SIZE = 4
+SUSPICION_TIMEOUT = 5.0
+# Number of registered nodes a joining node tries to start its lookups from before it gives up
+BOOTSTRAP_CONTACTS = 8
+# Number of successors that keep a copy of every key, and how many copies a write waits for (None waits for all)
+REPLICAS = 0
+WRITE_QUORUM = None
+# Number of nodes compared by latency when choosing a finger (proximity neighbour selection) and
+# when choosing the next hop (proximity route selection), 1 picks by identifier only
+PNS_CANDIDATES = 1
+PRS_CANDIDATES = 1
+# Batches of at least this many keys are routed with NumPy array operations when it is installed
+VECTORIZE_MIN_BATCH = 16
 
 class ApplicationLayerMessageTypes(Enum):
     FIND_SUCCESSOR_REQ = "FIND_SUCCESSOR_REQ"
@@ -15,11 +47,144 @@ class ApplicationLayerMessageTypes(Enum):
     FIND_PREDECESSOR_RESP = "FIND_PREDECESSOR_RESP"
     FIND_CLOSEST_PRECEDING_FINGER_REQ = "FIND_CLOSEST_PRECEDING_FINGER_REQ"
     FIND_CLOSEST_PRECEDING_FINGER_RESP = "FIND_CLOSEST_PRECEDING_FINGER_RESP"
+    FIND_SUCCESSORS_REQ = "FIND_SUCCESSORS_REQ"
+    FIND_SUCCESSORS_RESP = "FIND_SUCCESSORS_RESP"
+    KEY_TRANSFER_REQ = "KEY_TRANSFER_REQ"
+    KEY_TRANSFER_RESP = "KEY_TRANSFER_RESP"
+    KEY_HANDOFF_REQ = "KEY_HANDOFF_REQ"
+    KEY_HANDOFF_RESP = "KEY_HANDOFF_RESP"
+    STORE_REQ = "STORE_REQ"
+    STORE_RESP = "STORE_RESP"
+    FETCH_REQ = "FETCH_REQ"
+    FETCH_RESP = "FETCH_RESP"
+    REPLICATE_REQ = "REPLICATE_REQ"
+    REPLICATE_RESP = "REPLICATE_RESP"
+    REPLICA_TRANSFER_REQ = "REPLICA_TRANSFER_REQ"
+    REPLICA_TRANSFER_RESP = "REPLICA_TRANSFER_RESP"
+    GET_NEIGHBOURS_REQ = "GET_NEIGHBOURS_REQ"
+    GET_NEIGHBOURS_RESP = "GET_NEIGHBOURS_RESP"
+    SET_PREDECESSOR_REQ = "SET_PREDECESSOR_REQ"
+    SET_PREDECESSOR_RESP = "SET_PREDECESSOR_RESP"
+    SET_SUCCESSOR_REQ = "SET_SUCCESSOR_REQ"
+    SET_SUCCESSOR_RESP = "SET_SUCCESSOR_RESP"
+    # One way messages, there is no response
+    NOTIFY = "NOTIFY"
+    UPDATE_FINGER_TABLE = "UPDATE_FINGER_TABLE"
+    KEY_TRANSFER_ACK = "KEY_TRANSFER_ACK"
+    FIX_FINGERS_REQ = "FIX_FINGERS_REQ"
+    FIX_FINGERS_RESP = "FIX_FINGERS_RESP"
+    BATCH = "BATCH"
+
+
+RESPONSE_TYPES = {
+    ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ: ApplicationLayerMessageTypes.FIND_SUCCESSOR_RESP,
+    ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ: ApplicationLayerMessageTypes.FIND_PREDECESSOR_RESP,
+    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ: ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_RESP,
+    ApplicationLayerMessageTypes.FIND_SUCCESSORS_REQ: ApplicationLayerMessageTypes.FIND_SUCCESSORS_RESP,
+    ApplicationLayerMessageTypes.KEY_TRANSFER_REQ: ApplicationLayerMessageTypes.KEY_TRANSFER_RESP,
+    ApplicationLayerMessageTypes.KEY_HANDOFF_REQ: ApplicationLayerMessageTypes.KEY_HANDOFF_RESP,
+    ApplicationLayerMessageTypes.STORE_REQ: ApplicationLayerMessageTypes.STORE_RESP,
+    ApplicationLayerMessageTypes.FETCH_REQ: ApplicationLayerMessageTypes.FETCH_RESP,
+    ApplicationLayerMessageTypes.REPLICATE_REQ: ApplicationLayerMessageTypes.REPLICATE_RESP,
+    ApplicationLayerMessageTypes.REPLICA_TRANSFER_REQ: ApplicationLayerMessageTypes.REPLICA_TRANSFER_RESP,
+    ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ: ApplicationLayerMessageTypes.GET_NEIGHBOURS_RESP,
+    ApplicationLayerMessageTypes.SET_PREDECESSOR_REQ: ApplicationLayerMessageTypes.SET_PREDECESSOR_RESP,
+    ApplicationLayerMessageTypes.SET_SUCCESSOR_REQ: ApplicationLayerMessageTypes.SET_SUCCESSOR_RESP,
+    ApplicationLayerMessageTypes.FIX_FINGERS_REQ: ApplicationLayerMessageTypes.FIX_FINGERS_RESP,
+}
+
+
+class RoutingModes(Enum):
+    # The origin sends a message to every hop and picks the next hop from each response
+    ITERATIVE = "ITERATIVE"
+    # Each hop forwards the request to the next hop, the last hop answers the origin
+    RECURSIVE = "RECURSIVE"
 
 
 class ApplicationLayerMessageHeader(GenericMessageHeader):
-    def __init__(self, messagetype, source, destination):
+    def __init__(self, messagetype, source, destination, request_id=None):
         super().__init__(messagetype, source, destination)
+        # Responses carry the request_id of the request they answer
+        self.request_id = request_id
+
+
+class LookupPayload:
+    def __init__(self, key, origin, hops=0, avoid=(), latency=0.0):
+        self.key = key
+        self.origin = origin
+        self.hops = hops
+        # Identifiers of nodes the origin found unreachable, every hop routes around them
+        self.avoid = avoid
+        # Simulated latency of the links the lookup crossed so far
+        self.latency = latency
+
+
+class BatchLookupPayload:
+    def __init__(self, keys, origin):
+        self.keys = keys
+        self.origin = origin
+
+
+class LookupResult:
+    """
+    The outcome of a routing step.
+    If next_hop is None the lookup is finished: the key lies between predecessor and successor.
+    Otherwise next_hop is the node the lookup has to visit next.
+    latency is the simulated latency of the whole lookup, see LatencyModel.
+    """
+    def __init__(self, predecessor, successor, hops=0, next_hop=None, latency=0.0):
+        self.predecessor = predecessor
+        self.successor = successor
+        self.hops = hops
+        self.next_hop = next_hop
+        self.latency = latency
+
+    def __repr__(self):
+        return f"LookupResult(predecessor={self.predecessor.node_id}, successor={self.successor.node_id}, hops={self.hops})"
+
+
+class KeyRangePayload:
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+
+class ReplicaPayload:
+    def __init__(self, items):
+        # (key, value) pairs
+        self.items = items
+
+
+class FetchPayload:
+    def __init__(self, keys, owner=False):
+        self.keys = keys
+        # The keys are fetched from their owner, which rejects the ones it is not responsible for
+        self.owner = owner
+
+
+class FetchResult:
+    def __init__(self, values, rejected=()):
+        # The values of the fetched keys, None for the keys that are not stored
+        self.values = values
+        self.rejected = rejected
+
+
+class MigrationReport:
+    """
+    How many keys and bytes a join or a leave moved between nodes, and how long the transfer took.
+    """
+    def __init__(self, keys=0, size=0, seconds=0.0):
+        self.keys = keys
+        self.bytes = size
+        self.seconds = seconds
+
+    def add(self, other):
+        self.keys += other.keys
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+
+    def __repr__(self):
+        return f"MigrationReport(keys={self.keys}, bytes={self.bytes}, seconds={self.seconds:.6f})"
 
 
 class NotifyPayload:
@@ -27,25 +192,101 @@ class NotifyPayload:
         self.node = node
 
 
-class FingerTableEntry:
-    def __init__(self, start, node):
-        self.start = start
+class FingerUpdatePayload:
+    def __init__(self, node, index):
+        self.node = node
+        self.index = index
+
+
+class PointerPayload:
+    """
+    Asks to point the predecessor or successor at node, only if it still points at expected when that is given.
+    departed tells that expected is leaving the ring. The response carries the previous pointer as node.
+    """
+
+    def __init__(self, node, expected=None, departed=False):
         self.node = node
+        self.expected = expected
+        self.departed = departed
+
+
+class NeighboursPayload:
+    def __init__(self, predecessor, successor_list):
+        self.predecessor = predecessor
+        self.successor_list = successor_list
+
+
+class FingerTableEntry:
+    """
+    A view of the i-th finger of a FingerTable.
+    Nothing is stored per entry: the start is computed from the owner's node_id and the node is resolved from the table.
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def start(self):
+        return self.table.start(self.index)
+
+    @property
+    def node(self):
+        return self.table.finger(self.index)
+
+    @node.setter
+    def node(self, node):
+        self.table.update(self.index, node)
 
     def __repr__(self):
-        return f"FingerTableEntry(start={self.start}, node={self.node.node_id})"
+        return f"FingerTableEntry(start={self.start}, node={self.table.node_ids[self.index]})"
 
     def __str__(self):
-        return f"FingerTableEntry: {self.start}, Node: {self.node.node_id}"
+        return f"FingerTableEntry: {self.start}, Node: {self.table.node_ids[self.index]}"
+
+
+class FingerTableEntries:
+    """
+    The sequence of FingerTableEntry views of a FingerTable, so entries[i].node keeps working.
+    """
+    __slots__ = ("table",)
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table.node_ids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("finger index out of range")
+        return FingerTableEntry(self.table, i)
+
+    def __iter__(self):
+        return (FingerTableEntry(self.table, i) for i in range(len(self)))
 
 
 class FingerTable:
+    """
+    The finger table of a node, stored compactly.
+
+    Finger starts are not stored, they are computed from node_id and the identifier space. The fingers are kept
+    as node identifiers in one contiguous array (a list for identifier spaces wider than 64 bits)
+    and resolved to nodes through the registry.
+    """
+    __slots__ = ("node", "node_ids")
+
     def __init__(self, node):
         self.node = node
-        self.entries = [
-            FingerTableEntry((node.node_id + 2**i) % 2**SYSTEM_SIZE_BITS, node)
-            for i in range(SYSTEM_SIZE_BITS)
-        ]
+        ids = [node.node_id] * node.id_space.bits
+        self.node_ids = array("Q", ids) if node.id_space.bits <= 64 else ids
+
+    @property
+    def entries(self):
+        return FingerTableEntries(self)
 
     def __repr__(self):
         entries_repr = ", ".join(repr(entry) for entry in self.entries)
@@ -55,25 +296,33 @@ class FingerTable:
         entries_str = "\n".join(str(entry) for entry in self.entries)
         return f"FingerTable:\nNode: {self.node.node_id}\nEntries:\n{entries_str}"
 
-    def update(self, i, s):
-        self.entries[i].node = s
+    def start(self, i):
+        id_space = self.node.id_space
+        return (self.node.node_id + id_space.finger_offsets[i]) % id_space.size
 
+    def resolve(self, node_id):
+        if node_id == self.node.node_id:
+            return self.node
+        return self.node.registry.get_node(node_id)
 
-def between(_id: int, left: int, right: int, inclusive_left=False, inclusive_right=True) -> bool:
-    """
-    This code is taken from https://github.com/melzareix/chord-dht/blob/master/src/chord/helpers.py#L33-L46
-    Check if _id lies between left and right in a circular ring.
-    """
-    ring_sz = 2**SYSTEM_SIZE_BITS
-    if left != right:
-        if inclusive_left:
-            left = (left - 1 + ring_sz) % ring_sz
-        if inclusive_right:
-            right = (right + 1) % ring_sz
-    if left < right:
-        return left < _id < right
-    else:
-        return (_id > max(left, right)) or (_id < min(left, right))
+    def finger(self, i):
+        return self.resolve(self.node_ids[i])
+
+    def update(self, i, s):
+        with self.node.state_lock:
+            if self.node_ids[i] != s.node_id:
+                self.node_ids[i] = s.node_id
+                # Connect lazily the first time a finger points at a peer
+                self.node.connect(s)
+
+    def assign(self, node_ids):
+        """
+        Replaces every finger at once with the given node identifiers, in finger order.
+        """
+        if isinstance(self.node_ids, array):
+            self.node_ids = array("Q", node_ids)
+        else:
+            self.node_ids = list(node_ids)
 
 
 class ChordComponent(GenericModel):
@@ -84,14 +333,53 @@ class ChordComponent(GenericModel):
     The use of ahc components is different from its purpose since the ahc is hierarchical
     on the other hand there is no hierarchy in the Chord protocol which made it little bit hard to implement the Chord protocol using ahc.
 
-    There are queues for each type of message that is sent to the peer.
-    The queues are used to get the response from the peer.
-    When the response is received, the response is put in the queue.
-    The response is then retrieved from the queue and returned to the caller.
+    Every request sent to a peer gets a unique request_id and a future in the pending request table.
+    The peer copies the request_id into its response, and the response resolves the matching future,
+    so many requests can be in flight at the same time without stealing each other's responses.
+    A request that is not answered within request_timeout seconds is resent up to request_retries times.
+
+    Lookups travel the finger path hop by hop, every hop being a message to the closest preceding finger.
+    In ITERATIVE routing mode the origin asks each hop for the next one, in RECURSIVE mode the hops forward
+    the request themselves and the last hop answers the origin. The routing_mode configuration parameter selects one.
+
+    Every node keeps a list of its successor_list_size first successors, refreshed by stabilize().
+    A peer that refuses a message or does not answer a request is suspected for suspicion_timeout seconds:
+    lookups route around suspected fingers and successors right away instead of waiting for their timeouts,
+    and a crashed successor is replaced by the next live entry of the successor list.
+
+    If the stabilize_interval configuration parameter is set, a StabilizationScheduler periodically runs stabilize()
+    and refreshes one finger per fix_fingers_interval once the node has joined, and join() no longer fixes the fingers of the whole ring.
+
+    With the location_cache_size configuration parameter put and get go through a LocationCache of the owners of recently
+    looked up arcs, so repeated keys skip the finger path. Entries live for location_cache_ttl seconds and are dropped
+    when stabilize(), notify() or a suspicion observe a membership change, or when the cached owner rejects a put or get
+    of a key it is no longer responsible for.
+
+    With the coalesce_window configuration parameter outbound messages are coalesced per destination physical node
+    for up to coalesce_window seconds or coalesce_max_messages messages and sent as a single BATCH message.
+
+    With the replicas configuration parameter every key is also copied to the replica_store of that many successors,
+    and a write waits for write_quorum copies. Reads go to the nearest copy, so they keep working when the owner is gone.
+
+    With the virtual_nodes configuration parameter a component also hosts that many virtual nodes (VirtualChordComponent),
+    at identifiers hashed from its name and instance number, which join and leave the ring together with it.
+
+    Messages go over peer connections. A connection is made when a finger first points at a peer, or when send_to
+    first sends to it, for instance a hop of an iterative lookup. refresh_connections, run by stabilize(), prunes it
+    once no finger, successor or predecessor points at the peer, so between refreshes a node keeps its O(log N)
+    routing neighbours and the nodes it sent to since the last refresh.
+
+    A node only changes its own predecessor, successor list and finger table, under its state_lock. Other nodes
+    ask for changes with NOTIFY, UPDATE_FINGER_TABLE, SET_PREDECESSOR_REQ, SET_SUCCESSOR_REQ and FIX_FINGERS_REQ messages, so
+    handlers may run on several worker threads.
 
     The nodes in the network are identified by their node_id and joins the network by calling the join() method.
+    The identifier space (number of bits, ring size and key hashing) is shared by the ring through the ComponentRegistry.
     """
 
+    # Seconds for suspicions and cached locations, the virtual clock of the simulator under simulation.py
+    clock = staticmethod(time.monotonic)
+
     def __init__(
         self,
         componentname,
@@ -112,15 +400,99 @@ class ChordComponent(GenericModel):
 
         self.eventhandlers["msgfrompeer"] = self.on_message_from_peer
 
-        self.find_successor_result_queue = Queue()
-        self.find_predecessor_result_queue = Queue()
-        self.find_closest_preceding_finger_result_queue = Queue()
+        params = configuration_parameters or {}
+        self.request_timeout = params.get("request_timeout", REQUEST_TIMEOUT)
+        self.request_retries = params.get("request_retries", REQUEST_RETRIES)
+        self.pending_requests = {}
+        self.pending_requests_lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.routing_mode = RoutingModes(params.get("routing_mode", RoutingModes.ITERATIVE))
+        self.joined = False
+        self.alive = True
+        self.bootstrap_node = None
+        self.replicas = params.get("replicas", REPLICAS)
+        self.write_quorum = params.get("write_quorum", WRITE_QUORUM)
+        if self.write_quorum is not None and not 1 <= self.write_quorum <= self.replicas + 1:
+            raise ValueError(f"write_quorum must be between 1 and replicas + 1 = {self.replicas + 1}, got {self.write_quorum}")
+        self.successor_list_size = params.get("successor_list_size", max(SUCCESSOR_LIST_SIZE, self.replicas))
+        self.pns_candidates = params.get("pns_candidates", PNS_CANDIDATES)
+        self.prs_candidates = params.get("prs_candidates", PRS_CANDIDATES)
+        self.suspicion_timeout = params.get("suspicion_timeout", SUSPICION_TIMEOUT)
+        self.successor_list = []
+        self.suspected = {}
+        # Routing neighbours connected as peers, see refresh_connections
+        self.peers = set()
+        self.peers_lock = threading.Lock()
+        # Guards the predecessor, successor list and finger table against concurrent handlers, see set_predecessor
+        self.state_lock = threading.RLock()
+        self.maintenance = None
+        if params.get("stabilize_interval") is not None:
+            self.maintenance = StabilizationScheduler(
+                self,
+                stabilize_interval=params["stabilize_interval"],
+                fix_fingers_interval=params.get("fix_fingers_interval", FIX_FINGERS_INTERVAL),
+                finger_selection=params.get("finger_selection", FingerSelection.ROUND_ROBIN),
+                seed=params.get("seed"),
+            )
 
         self.predecessor = None
-        self.node_id = componentinstancenumber
         self.registry = ComponentRegistry()
+        self.id_space = self.registry.id_space
+        self.node_id = componentinstancenumber % self.id_space.size
+        self.metrics = NodeMetrics(self.node_id)
         self.finger_table = FingerTable(self)
-        self.keys = set()
+        self.store = KeyValueStore(self.id_space)
+        # Copies of the keys of the nodes preceding this one
+        self.replica_store = KeyValueStore(self.id_space)
+        self.location_cache = None
+        if params.get("location_cache_size", 0) > 0:
+            self.location_cache = LocationCache(
+                self.id_space,
+                capacity=params["location_cache_size"],
+                ttl=params.get("location_cache_ttl", LOCATION_CACHE_TTL),
+                clock=self.clock,
+            )
+        self.coalescer = None
+        if params.get("coalesce_window") is not None:
+            self.coalescer = OutboundCoalescer(
+                self._send_batch,
+                window=params["coalesce_window"],
+                max_messages=params.get("coalesce_max_messages", COALESCE_MAX_MESSAGES),
+                busy=lambda host: not host.inputqueue.empty(),
+            )
+        self.host = self
+        self.virtual_nodes = []
+        for i in range(1, params.get("virtual_nodes", 0) + 1):
+            self.add_virtual_node(self.id_space.hash_key(f"{componentname}-{componentinstancenumber}-{i}"))
+
+    def add_virtual_node(self, node_id):
+        """
+        Hosts another identifier of the ring in this component, see VirtualChordComponent. Call it before the node joins.
+        """
+        params = {
+            k: v for k, v in (self.configurationparameters or {}).items() if k not in ("virtual_nodes", "coalesce_window")
+        }
+        node = VirtualChordComponent(self, node_id, params)
+        self.virtual_nodes.append(node)
+        self.components.append(node)
+        return node
+
+    def on_exit(self, eventobj: Event):
+        if self.maintenance is not None:
+            self.maintenance.stop()
+        if self.coalescer is not None and self.host is self:
+            self.coalescer.stop()
+        super().on_exit(eventobj)
+
+    def crash(self):
+        """
+        Simulates a crash failure: the node stops answering and stops its maintenance without telling any other node.
+        """
+        self.alive = False
+        if self.maintenance is not None:
+            self.maintenance.stop()
+        for node in self.virtual_nodes:
+            node.crash()
 
     def __repr__(self):
         return f"ChordComponent(componentname={self.componentname}, componentinstancenumber={self.componentinstancenumber}, node_id={self.node_id})"
@@ -130,248 +502,1571 @@ class ChordComponent(GenericModel):
         hdr = chord_message.header
         payload = chord_message.payload
 
-        # Check if the message is for this node
+        # Check if the message is for this node or one of the virtual nodes it hosts
         if hdr.messageto != self:
+            if hdr.messageto in self.virtual_nodes:
+                hdr.messageto.on_message_from_peer(eventobj)
+            return
+        if not self.alive:
+            return
+        if hdr.messagetype == ApplicationLayerMessageTypes.BATCH:
+            # Messages coalesced by the sender, see OutboundCoalescer
+            self.metrics.increment("batches_received")
+            for message in payload:
+                self.on_message_from_peer(Event(eventobj.eventsource, EventTypes.MFRP, message))
             return
+        self.metrics.increment("messages_received")
+        if self.suspected and getattr(hdr.messagefrom, "node_id", None) in self.suspected:
+            # We heard from the peer, so it is alive after all
+            self.suspected.pop(hdr.messagefrom.node_id, None)
 
-        if hdr.messagetype == ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ:
-            successor = self._find_successor(payload)
+        if hdr.messagetype in (
+            ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ,
+            ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ,
+        ):
+            # Recursive routing: answer the origin if the key is in our successor's interval, forward otherwise
+            avoid = set(payload.avoid)
+            step = self._lookup_step(payload.key, avoid)
+            while step.next_hop is not None and not self.send_to(
+                step.next_hop,
+                GenericMessage(
+                    ApplicationLayerMessageHeader(
+                        hdr.messagetype,
+                        self,
+                        step.next_hop,
+                        request_id=hdr.request_id,
+                    ),
+                    LookupPayload(
+                        payload.key,
+                        payload.origin,
+                        payload.hops + 1,
+                        payload.avoid,
+                        payload.latency + self.latency_to(step.next_hop),
+                    ),
+                ),
+            ):
+                # The next hop is unreachable, route around it
+                avoid.add(step.next_hop.node_id)
+                step = self._lookup_step(payload.key, avoid)
+            if step.next_hop is None:
+                step.hops = payload.hops
+                step.latency = payload.latency + self.latency_to(payload.origin)
+                resp = GenericMessage(
+                    ApplicationLayerMessageHeader(
+                        RESPONSE_TYPES[hdr.messagetype],
+                        self,
+                        payload.origin,
+                        request_id=hdr.request_id,
+                    ),
+                    step,
+                )
+                self.send_to(payload.origin, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ:
+            # Iterative routing: a single routing step, the origin decides where to go next
             resp = GenericMessage(
                 ApplicationLayerMessageHeader(
-                    ApplicationLayerMessageTypes.FIND_SUCCESSOR_RESP,
-                    self.componentinstancenumber,
+                    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_RESP,
+                    self,
                     hdr.messagefrom,
+                    request_id=hdr.request_id,
                 ),
-                successor,
+                self._lookup_step(payload.key, payload.avoid, payload.origin),
             )
-            self.send_peer(Event(self, EventTypes.MFRP, resp))
+            self.send_to(hdr.messagefrom, resp)
 
-        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_SUCCESSOR_RESP:
-            self.find_successor_result_queue.put_nowait(payload)
+        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_SUCCESSORS_REQ:
+            # Batched iterative routing: one routing step for every key of the batch
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.FIND_SUCCESSORS_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                self._lookup_steps(payload.keys),
+            )
+            self.send_to(hdr.messagefrom, resp)
 
-        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ:
-            predecessor = self._find_predecessor(payload)
+        elif hdr.messagetype == ApplicationLayerMessageTypes.KEY_TRANSFER_REQ:
+            # A node joined as our predecessor, copy the arc it owns now in a single message. The keys stay here until
+            # it acknowledges them, so a response that is lost or comes too late loses nothing
             resp = GenericMessage(
                 ApplicationLayerMessageHeader(
-                    ApplicationLayerMessageTypes.FIND_PREDECESSOR_RESP,
-                    self.componentinstancenumber,
+                    ApplicationLayerMessageTypes.KEY_TRANSFER_RESP,
+                    self,
                     hdr.messagefrom,
+                    request_id=hdr.request_id,
                 ),
-                predecessor,
+                self.store.copy_range(payload.left, payload.right),
             )
-            self.send_peer(Event(self, EventTypes.MFRP, resp))
+            self.send_to(hdr.messagefrom, resp)
 
-        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_PREDECESSOR_RESP:
-            self.find_predecessor_result_queue.put_nowait(payload)
+        elif hdr.messagetype == ApplicationLayerMessageTypes.KEY_TRANSFER_ACK:
+            # Our predecessor stored the arc we copied to it, drop our copy
+            self.store.split_range(payload.left, payload.right)
 
-        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ:
-            closest_finger = self._closest_preceding_finger(payload)
+        elif hdr.messagetype == ApplicationLayerMessageTypes.KEY_HANDOFF_REQ:
+            # Our predecessor is leaving and hands over all of its keys
+            self.store.merge(payload)
             resp = GenericMessage(
                 ApplicationLayerMessageHeader(
-                    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_RESP,
-                    self.componentinstancenumber,
+                    ApplicationLayerMessageTypes.KEY_HANDOFF_RESP,
+                    self,
                     hdr.messagefrom,
+                    request_id=hdr.request_id,
                 ),
-                closest_finger,
+                len(payload),
             )
-            self.send_peer(Event(self, EventTypes.MFRP, resp))
+            self.send_to(hdr.messagefrom, resp)
 
-        elif hdr.messagetype == ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_RESP:
-            self.find_closest_preceding_finger_result_queue.put(payload)
+        elif hdr.messagetype == ApplicationLayerMessageTypes.STORE_REQ:
+            # The owner's copy of a write, the response lists the keys we are not responsible for and did not store
+            rejected = []
+            for key, value in payload.items:
+                if self.accepts(self.id_space.hash_key(key)):
+                    self.store.put(key, value)
+                else:
+                    rejected.append(key)
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.STORE_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                rejected,
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.FETCH_REQ:
+            # The values of the keys we keep, as their owner or as a replica, None for the others
+            values = []
+            rejected = []
+            for key in payload.keys:
+                if payload.owner and not self.accepts(self.id_space.hash_key(key)):
+                    rejected.append(key)
+                    values.append(None)
+                    continue
+                value = self.store.get(key)
+                values.append(self.replica_store.get(key) if value is None else value)
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.FETCH_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                FetchResult(values, rejected),
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.REPLICATE_REQ:
+            for key, value in payload.items:
+                self.replica_store.put(key, value)
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.REPLICATE_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                len(payload.items),
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.REPLICA_TRANSFER_REQ:
+            # A node that joined in front of us copies the replicas it keeps from now on
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.REPLICA_TRANSFER_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                ReplicaPayload(self.replica_store.range(payload.left, payload.right)),
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ:
+            # Stabilization of our predecessor asks for our predecessor and successor list
+            with self.state_lock:
+                neighbours = NeighboursPayload(self.predecessor, list(self.successor_list))
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.GET_NEIGHBOURS_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                neighbours,
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.SET_PREDECESSOR_REQ:
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.SET_PREDECESSOR_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                PointerPayload(self.set_predecessor(payload.node, payload.expected)),
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.SET_SUCCESSOR_REQ:
+            resp = GenericMessage(
+                ApplicationLayerMessageHeader(
+                    ApplicationLayerMessageTypes.SET_SUCCESSOR_RESP,
+                    self,
+                    hdr.messagefrom,
+                    request_id=hdr.request_id,
+                ),
+                PointerPayload(self.set_successor(payload.node, payload.expected, payload.departed)),
+            )
+            self.send_to(hdr.messagefrom, resp)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.NOTIFY:
+            self.notify(payload.node)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.UPDATE_FINGER_TABLE:
+            self.update_finger_table(payload.node, payload.index)
+
+        elif hdr.messagetype == ApplicationLayerMessageTypes.FIX_FINGERS_REQ:
+            # The lookups of the refresh wait for responses that our workers receive, so it runs on a thread of its own
+            threading.Thread(target=self._fix_fingers_and_reply, args=(hdr,), daemon=True).start()
+
+        elif hdr.messagetype in RESPONSE_TYPES.values():
+            self.resolve_request(hdr.request_id, payload)
 
     def successor(self):
         return self.finger_table.entries[0].node
 
-    def inner_queue_handler(self, queue):
-        return queue.get()
+    def suspect(self, node):
+        if node is not None and node is not self:
+            self.metrics.increment("suspicions")
+            self.suspected[node.node_id] = self.clock()
+            self._invalidate_locations(node)
 
-    def create_remote_event(self, message_type: ApplicationLayerMessageTypes, queue, node_id):
-        #import ipdb; ipdb.set_trace()
-        other_node = self.registry.get_arbitrary_component(
-            self.componentname, self.componentinstancenumber
+    def is_suspected(self, node_id):
+        suspected_at = self.suspected.get(node_id)
+        if suspected_at is None:
+            return False
+        if self.clock() - suspected_at > self.suspicion_timeout:
+            # Give the peer another chance
+            self.suspected.pop(node_id, None)
+            return False
+        return True
+
+    def is_alive(self, node, avoid=()):
+        """
+        Whether node can be routed to as far as this node knows: it exists, it is not in avoid and it is not suspected.
+        A crash only shows once the node is contacted, see send_to.
+        """
+        if node is None:
+            return False
+        if node is self:
+            return True
+        return node.node_id not in avoid and not self.is_suspected(node.node_id)
+
+    def suspected_ids(self):
+        """
+        The identifiers of the nodes this node currently suspects, which a lookup it starts routes around.
+        """
+        return {node_id for node_id in list(self.suspected) if self.is_suspected(node_id)}
+
+    def live_successor(self, avoid=()):
+        """
+        The first successor that is alive, from the successor pointer and then the successor list.
+        """
+        successor = self.successor()
+        if self.is_alive(successor, avoid):
+            return successor
+        for node in self.successor_list:
+            if self.is_alive(node, avoid):
+                return node
+        return self
+
+    def contact(self, node):
+        """
+        Connects to node. Returns False, and suspects the node, if it refuses the connection because it crashed.
+        """
+        if node is self or node.alive:
+            return True
+        self.metrics.increment("send_failures")
+        self.suspect(node)
+        return False
+
+    def send_to(self, node, message):
+        """
+        Delivers a message to a single peer over its connector, connecting to it first if it is not a peer yet.
+        Unlike send_peer, the message is not broadcast to every connected peer.
+        Returns False, and suspects the peer, if the peer refuses the connection because it crashed.
+        """
+        if not self.contact(node):
+            return False
+        if node not in self.peers:
+            self.connect(node)
+        self.metrics.increment("messages_sent")
+        if self.maintenance is not None and threading.current_thread() is self.maintenance.thread:
+            self.metrics.increment("maintenance_messages")
+        if self.coalescer is not None:
+            # Messages to all nodes hosted by the same physical node share a batch
+            self.coalescer.send(node.host, message)
+        else:
+            node.trigger_event(Event(self, EventTypes.MFRP, message))
+        return True
+
+    def _send_batch(self, host, messages):
+        if len(messages) == 1:
+            host.trigger_event(Event(self, EventTypes.MFRP, messages[0]))
+            return
+        self.metrics.increment("batches_sent")
+        batch = GenericMessage(
+            ApplicationLayerMessageHeader(ApplicationLayerMessageTypes.BATCH, self, host),
+            messages,
         )
-        if other_node == self:
-            if message_type == ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ:
-                return self._find_successor(node_id)
-            elif message_type == ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ:
-                return self._find_predecessor(node_id)
-            elif message_type == ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ:
-                return self._closest_preceding_finger(node_id)
-        req = GenericMessage(
-            ApplicationLayerMessageHeader(message_type, self, other_node),
-            node_id,
+        host.trigger_event(Event(self, EventTypes.MFRP, batch))
+
+    def send_message(self, node, message_type: ApplicationLayerMessageTypes, payload):
+        """
+        Sends a one way message, such as NOTIFY, without waiting for anything.
+        """
+        return self.send_to(
+            node,
+            GenericMessage(ApplicationLayerMessageHeader(message_type, self, node), payload),
         )
-        self.send_peer(Event(self, EventTypes.MFRP, req))
+
+    def resolve_request(self, request_id, result):
+        """
+        Completes the pending request with the given request_id.
+        Responses to requests that already completed or gave up are dropped.
+        """
+        with self.pending_requests_lock:
+            future = self.pending_requests.pop(request_id, None)
+        if future is not None:
+            future.set_result(result)
+
+    def send_request(self, node, message_type: ApplicationLayerMessageTypes, payload, timeout=None):
+        """
+        Sends a request to node and blocks until its response arrives.
+        Returns None if there is no response after request_retries retries.
+        """
+        return self.send_requests([(node, message_type, payload)], timeout=timeout)[0]
+
+    def send_requests(self, requests, quorum=None, timeout=None):
+        """
+        Sends a list of (node, message_type, payload) requests at once and blocks until all of them are answered,
+        or only until quorum of them are. Returns the responses in the order of the requests, None for the ones
+        that were not answered (yet). Each attempt waits timeout seconds, request_timeout by default.
+        """
+        outstanding = {}
+        for node, message_type, payload in requests:
+            request_id, req, future = self._new_request(node, message_type, payload)
+            outstanding[request_id] = (node, req, future)
+        futures = [future for _, _, future in outstanding.values()]
         try:
-            return queue.get(timeout=0.1)  # Add timeout here
-        except Empty:    # handle exception here
-            return None
+            unanswered = list(outstanding.items())
+            for attempt in range(self.request_retries + 1):
+                for request_id, (node, req, future) in unanswered:
+                    if not self.send_to(node, req):
+                        self.resolve_request(request_id, None)
+                self._wait_for([future for _, (_, _, future) in unanswered], futures, quorum, timeout)
+                unanswered = [item for item in unanswered if not item[1][2].done()]
+                if not unanswered or (quorum is not None and self._answered(futures) >= quorum):
+                    break
+                for request_id, (node, req, _) in unanswered:
+                    self.metrics.increment("timeouts")
+                    self.suspect(node)
+                    logger.warning(
+                        f"{self} {req.header.messagetype.value} {request_id} to node {node.node_id} timed out (attempt {attempt + 1})"
+                    )
+            return [future.result() if future.done() else None for future in futures]
+        finally:
+            with self.pending_requests_lock:
+                for request_id in outstanding:
+                    self.pending_requests.pop(request_id, None)
 
-    def find_successor(self, node_id):
-        return self.create_remote_event(
-            ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ,
-            self.find_successor_result_queue,
-            node_id,
+    def _new_request(self, node, message_type, payload):
+        """
+        Registers a pending request and returns its request_id, the message to send and the Future of its response.
+        """
+        with self.pending_requests_lock:
+            request_id = next(self.request_ids)
+            future = Future()
+            self.pending_requests[request_id] = future
+        req = GenericMessage(
+            ApplicationLayerMessageHeader(message_type, self, node, request_id=request_id),
+            payload,
         )
+        return request_id, req, future
 
-    def find_predecessor(self, node_id):
-        return self.create_remote_event(
-            ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ,
-            self.find_predecessor_result_queue,
-            node_id,
-        )
+    @staticmethod
+    def _answered(futures):
+        return sum(1 for future in futures if future.done() and future.result() is not None)
 
-    def closest_preceding_finger(self, node_id):
-        return self.create_remote_event(
-            ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ,
-            self.find_closest_preceding_finger_result_queue,
-            node_id,
-        )
+    def _wait_for(self, pending, futures, quorum, timeout=None):
+        """
+        Waits up to timeout, request_timeout by default, for the pending futures, or until quorum of all futures have a response.
+        """
+        timeout = self.request_timeout if timeout is None else timeout
+        if quorum is None:
+            wait(pending, timeout=timeout)
+            return
+        deadline = time.monotonic() + timeout
+        pending = set(pending)
+        while pending and self._answered(futures) < quorum:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                return
 
-    def _find_successor(self, node_id):
-        self.registry.find_successor += 1
-        if self.node_id == self.successor().node_id or self.node_id == self.predecessor.node_id:
+    def _entry_node(self):
+        """
+        The node a lookup starts from: this node once it is part of the ring, a bootstrap node while it is joining.
+        """
+        if self.joined:
             return self
+        if self.bootstrap_node is not None:
+            return self.bootstrap_node
+        return self.registry.get_arbitrary_component(
+            self.componentname, self.componentinstancenumber
+        )
+
+    def bootstrap_contacts(self):
+        """
+        The nodes a joining node may start its lookups from: the one the registry picks, then up to
+        BOOTSTRAP_CONTACTS - 1 other registered nodes at random, since crashed nodes stay registered.
+        """
+        first = self.registry.get_arbitrary_component(self.componentname, self.componentinstancenumber)
+        if first is not None:
+            yield first
+        others = [node for node in list(self.registry.components.values()) if node is not self and node is not first]
+        yield from random.sample(others, min(BOOTSTRAP_CONTACTS - 1, len(others)))
+
+    def lookup(self, node_id, message_type=ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ):
+        """
+        Routes a lookup for node_id through the ring and returns a LookupResult,
+        holding the predecessor and the successor of node_id and the number of messages it took.
+        Returns None if a hop did not answer.
+        """
+        self.metrics.increment("lookups_started")
+        started = time.perf_counter()
+        result = self._run_walk(self._lookup_walk(node_id, message_type))
+        self._record_lookup(result, time.perf_counter() - started)
+        return result
+
+    def _record_lookup(self, result, seconds):
+        if result is None:
+            self.metrics.increment("failed_lookups")
         else:
-            predecessor = self._find_predecessor(node_id)
-            return predecessor.successor()
+            # Without a latency model every lookup has a simulated latency of zero, which is not worth reporting
+            simulated_latency = None if self.registry.latency_model is None else result.latency
+            self.metrics.record_lookup(result.hops, seconds, simulated_latency)
 
-    def _find_predecessor(self, node_id):
-        self.registry.find_predecessor += 1
-        other_node = self
-        while not between(
+    def _run_walk(self, walk):
+        """
+        Drives a lookup walk, see _lookup_walk, sending each request it yields and waiting for the response.
+        """
+        try:
+            request = next(walk)
+            while True:
+                request = walk.send(self.send_request(*request))
+        except StopIteration as done:
+            return done.value
+
+    def _lookup_walk(self, node_id, message_type):
+        """
+        The route of a lookup for node_id as a generator, so the blocking lookup and an event driven one share it.
+        It yields the (node, message_type, payload) requests to send, takes the response of each, None if there is
+        none, and returns the LookupResult, or None if the lookup failed.
+        """
+        if self.routing_mode == RoutingModes.RECURSIVE:
+            node = self._entry_node()
+            avoid = self.suspected_ids()
+            if node is self:
+                step = self._lookup_step(node_id, avoid)
+                if step.next_hop is None:
+                    return step
+                node = step.next_hop
+            result = yield node, message_type, LookupPayload(node_id, self, 1, frozenset(avoid), self.latency_to(node))
+            if result is not None:
+                return result
+            # Some hop dropped the lookup and the origin cannot tell which one: walking the route iteratively finds
+            # and suspects it, so later lookups route around it instead of timing out again
+        return (yield from self._iterative_walk(node_id))
+
+    def _lookup_iterative(self, node_id):
+        return self._run_walk(self._iterative_walk(node_id))
+
+    def _iterative_walk(self, node_id):
+        node = self._entry_node()
+        hops = 0
+        latency = 0.0
+        avoid = self.suspected_ids()
+        path = []
+        while True:
+            if node is self:
+                step = self._lookup_step(node_id, avoid)
+            else:
+                step = yield (
+                    node,
+                    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ,
+                    LookupPayload(node_id, self, hops, frozenset(avoid)),
+                )
+                if step is None:
+                    # The hop failed, ask the previous hop again for a route around it
+                    avoid.add(node.node_id)
+                    if not path:
+                        return None
+                    node = path.pop()
+                    continue
+                hops += 1
+                # A request and its response
+                latency += 2 * self.latency_to(node)
+            if step.next_hop is None:
+                step.hops = hops
+                step.latency = latency
+                return step
+            if self.is_suspected(step.next_hop.node_id):
+                # We suspect the hop even if the node that chose it does not, ask that node for a route around it
+                avoid.add(step.next_hop.node_id)
+                continue
+            path.append(node)
+            node = step.next_hop
+
+    def _lookup_step(self, node_id, avoid=(), origin=None):
+        """
+        One routing step at this node.
+        The lookup is finished if node_id is in (self, successor], otherwise next_hop is the closest preceding finger.
+        Unreachable fingers and successors, and the ones in avoid, are skipped.
+        origin is the node that will send the next request in iterative routing, this node otherwise.
+        """
+        # The routing steps a node serves are its share of the lookup load
+        self.metrics.increment("routing_steps")
+        successor = self.live_successor(avoid)
+        if self.id_space.between(
             node_id,
-            other_node.node_id,
-            other_node.successor().node_id,
+            self.node_id,
+            successor.node_id,
             inclusive_left=False,
             inclusive_right=True,
         ):
-            other_node = other_node._closest_preceding_finger(node_id)
-        return other_node
-
-    def _closest_preceding_finger(self, node_id):
-        self.registry.closest_preceding_finger += 1
-        for i in range(SYSTEM_SIZE_BITS - 1, -1, -1):
-            if between(
-                self.finger_table.entries[i].node.node_id,
+            return LookupResult(self, successor)
+        next_hop = self._closest_preceding_finger(node_id, avoid, origin)
+        if next_hop is self:
+            # None of our fingers precede node_id, so our successor is the best answer we know
+            return LookupResult(self, successor)
+        return LookupResult(self, successor, next_hop=next_hop)
+
+    def _lookup_steps(self, keys):
+        """
+        Routing steps for a batch of keys, evaluated over all keys at once with array operations when NumPy is available.
+        """
+        if not vectorized.AVAILABLE or len(keys) < VECTORIZE_MIN_BATCH or self.suspected or self.prs_candidates > 1:
+            return [self._lookup_step(key) for key in keys]
+        self.metrics.increment("routing_steps", len(keys))
+        successor = self.live_successor()
+        finished = vectorized.between(
+            vectorized.as_ids(keys, self.id_space),
+            self.node_id,
+            successor.node_id,
+            self.id_space.size,
+            inclusive_left=False,
+            inclusive_right=True,
+        )
+        fingers = vectorized.closest_preceding_fingers(
+            self.node_id, self.finger_table.node_ids, keys, self.id_space
+        )
+        steps = []
+        for key, done, finger in zip(keys, finished.tolist(), fingers.tolist()):
+            if done or finger < 0:
+                steps.append(LookupResult(self, successor))
+                continue
+            next_hop = self.finger_table.finger(finger)
+            if self.is_alive(next_hop):
+                steps.append(LookupResult(self, successor, next_hop=next_hop))
+            else:
+                steps.append(self._lookup_step(key))
+        return steps
+
+    def find_successor(self, node_id):
+        result = self.lookup(node_id, ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ)
+        return result.successor if result is not None else None
+
+    def find_predecessor(self, node_id):
+        result = self.lookup(node_id, ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ)
+        return result.predecessor if result is not None else None
+
+    def find_successors(self, keys):
+        """
+        Resolves the successors of many identifiers at once and returns a dict from identifier to successor.
+
+        The identifiers are sorted clockwise from this node and routed iteratively in groups:
+        in every round the identifiers waiting at the same hop are sent to it in a single message,
+        so a batch costs one message per destination per round instead of one lookup per identifier.
+        """
+        size = self.id_space.size
+        keys = sorted(set(keys), key=lambda key: (key - self.node_id) % size)
+        results = {}
+        waiting = {self._entry_node(): keys}
+        while waiting:
+            groups = list(waiting.items())
+            responses = iter(self.send_requests([
+                (node, ApplicationLayerMessageTypes.FIND_SUCCESSORS_REQ, BatchLookupPayload(group, self))
+                for node, group in groups
+                if node is not self
+            ]))
+            waiting = {}
+            for node, group in groups:
+                if node is self:
+                    steps = self._lookup_steps(group)
+                else:
+                    steps = next(responses)
+                    if steps is None and self.joined:
+                        # The hop failed and is suspected now, route its keys around it from here
+                        waiting.setdefault(self, []).extend(group)
+                        continue
+                    steps = steps or [None] * len(group)
+                for key, step in zip(group, steps):
+                    if step is None:
+                        results[key] = None
+                    elif step.next_hop is None:
+                        results[key] = step.successor
+                        if self.location_cache is not None:
+                            self.location_cache.put(step.predecessor.node_id, step.successor)
+                    elif self.is_suspected(step.next_hop.node_id):
+                        # Batches carry no nodes to avoid, so route this key around the hop with a lookup of its own
+                        result = self._lookup_iterative(key)
+                        results[key] = result.successor if result is not None else None
+                    else:
+                        waiting.setdefault(step.next_hop, []).append(key)
+        return results
+
+    def put_many(self, items):
+        """
+        Stores many keys with a single batched lookup, see owners_of, and replicates them, see write.
+        items is either a dict from key to value or an iterable of keys, which are stored with empty values.
+        Returns the keys whose writes did not reach the write quorum.
+        """
+        items = list(items.items()) if isinstance(items, dict) else [(key, b"") for key in items]
+        return self.write(self._place(items, key=itemgetter(0)))
+
+    def get_many(self, keys):
+        """
+        Looks up many keys with a single batched lookup, see owners_of, and returns a dict from key to value, or None if it is not stored.
+        """
+        return self.read(self._place(list(keys)))
+
+    def _place(self, entries, key=lambda entry: entry):
+        """
+        Groups keys, or entries such as (key, value) pairs with a key function, by the owner of the key, see owners_of.
+        Returns a dict from owner to entries.
+        """
+        owners = self.owners_of(self.id_space.hash_key(key(entry)) for entry in entries)
+        placements = {}
+        for entry in entries:
+            placements.setdefault(owners[self.id_space.hash_key(key(entry))], []).append(entry)
+        return placements
+
+    def _place_rejected(self, rejected, key=lambda entry: entry):
+        """
+        Owners reject the keys they are not responsible for, when they were cached before a membership change or a
+        lookup raced one. Forgets the cached arcs of the owners in the dict from owner to rejected entries and places
+        the entries anew, see _place.
+        """
+        entries = [entry for owner_entries in rejected.values() for entry in owner_entries]
+        self.metrics.increment("location_cache_rejections", len(entries))
+        for owner in rejected:
+            self._invalidate_locations(owner)
+        return self._place(entries, key)
+
+    def successor_lists(self, owners):
+        """
+        Asks every owner for its successor list with one batch of GET_NEIGHBOURS requests. Returns a dict from owner to
+        its successor list, empty for the owners that did not answer, or for all of them without replication.
+        """
+        owners = {owner for owner in owners if owner is not None}
+        if self.replicas <= 0:
+            return {owner: [] for owner in owners}
+        remote = [owner for owner in owners if owner is not self]
+        responses = self.send_requests([(owner, ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ, None) for owner in remote])
+        lists = {owner: [] if response is None else response.successor_list for owner, response in zip(remote, responses)}
+        if self in owners:
+            with self.state_lock:
+                lists[self] = list(self.successor_list)
+        return lists
+
+    def replica_set(self, owner, without=None, successors=None):
+        """
+        The nodes that keep a key of owner: owner followed by up to replicas of its live successors,
+        skipping virtual nodes of physical nodes that already keep it, and without, a node that is leaving.
+        successors is the successor list of owner, see successor_lists, owner is asked for it if it is not given.
+        """
+        nodes = [owner]
+        if self.replicas <= 0:
+            return nodes
+        if successors is None:
+            successors = self.successor_lists([owner])[owner]
+        hosts = {owner.host}
+        for node in successors:
+            if len(nodes) > self.replicas:
+                break
+            if node is not without and node.host not in hosts and self.is_alive(node):
+                nodes.append(node)
+                hosts.add(node.host)
+        return nodes
+
+    def write(self, placements, place_rejected=True):
+        """
+        Writes the (key, value) pairs of a dict from owner to pairs.
+        Every owner gets its pairs in a single STORE message and every replica all of its pairs in a single REPLICATE
+        message, all of them sent at once.
+        A key is written once write_quorum of its copies, the owner's included, are acknowledged, or all copies of its
+        replica set when write_quorum is not set; when all pairs have the same owner the write returns as soon as
+        enough copies are acknowledged, otherwise it waits for all of them. A node that fails is suspected, so a second
+        round copies the keys that are still short to the live successors after it.
+        Pairs an owner rejects are placed at their owners looked up again and written once more, if place_rejected is set.
+        Returns the keys that did not reach the quorum.
+        """
+        acks = {}
+        required = {}
+        tried = {}
+        rejected = {}
+        successors = self.successor_lists(placements)
+        for owner, items in placements.items():
+            if owner is None:
+                for key, _ in items:
+                    acks[key] = 0
+                    required[key] = 1
+                continue
+            needed = self.write_quorum or len(self.replica_set(owner, successors=successors[owner]))
+            for key, _ in items:
+                acks[key] = 0
+                required[key] = needed
+            tried[owner] = set()
+        for attempt in range(2):
+            by_copy = {}
+            for owner, nodes in tried.items():
+                items = placements[owner]
+                if attempt > 0:
+                    kept = {key for key, _ in rejected.get(owner, ())}
+                    items = [item for item in items if acks[item[0]] < required[item[0]] and item[0] not in kept]
+                if not items:
+                    continue
+                for node in self.replica_set(owner, successors=successors[owner]):
+                    if node not in nodes:
+                        nodes.add(node)
+                        message_type = (
+                            ApplicationLayerMessageTypes.STORE_REQ if node is owner else ApplicationLayerMessageTypes.REPLICATE_REQ
+                        )
+                        by_copy.setdefault((node, message_type), []).extend(items)
+            if not by_copy:
+                break
+            quorum = None
+            if len(tried) == 1:
+                key = placements[next(iter(tried))][0][0]
+                quorum = max(0, required[key] - acks[key])
+            requests = [(node, message_type, ReplicaPayload(items)) for (node, message_type), items in by_copy.items()]
+            for (node, message_type, payload), response in zip(requests, self.send_requests(requests, quorum=quorum)):
+                if response is None:
+                    continue
+                refused = set(response) if message_type == ApplicationLayerMessageTypes.STORE_REQ else ()
+                for key, value in payload.items:
+                    if key in refused:
+                        rejected.setdefault(node, []).append((key, value))
+                    else:
+                        acks[key] += 1
+        if rejected and place_rejected:
+            for owner_items in rejected.values():
+                for key, _ in owner_items:
+                    del acks[key]
+            failed = self.write(self._place_rejected(rejected, key=itemgetter(0)), place_rejected=False)
+        else:
+            failed = []
+        failed += [key for key, count in acks.items() if count < required[key]]
+        if failed:
+            self.metrics.increment("quorum_failures", len(failed))
+        return failed
+
+    def _replicate(self, by_replica, quorum=None):
+        """
+        Sends every node of a dict from node to (key, value) pairs its pairs in a single REPLICATE message.
+        Returns (node, payload, response) triples, the response None for the nodes that did not answer.
+        """
+        requests = [
+            (node, ApplicationLayerMessageTypes.REPLICATE_REQ, ReplicaPayload(items))
+            for node, items in by_replica.items()
+        ]
+        responses = self.send_requests(requests, quorum=quorum)
+        return [(node, payload, response) for (node, _, payload), response in zip(requests, responses)]
+
+    def read(self, placements, place_rejected=True):
+        """
+        Reads the keys of a dict from owner to keys. Returns a dict from key to value, None if the key is not stored.
+        The keys of an owner are fetched from the nearest node of its replica set, ties broken at random to spread the
+        load, and the keys that node does not have or does not answer for from the next one. A replica also answers
+        when the owner is slow or gone and the lookup ended at its successor. The FETCH messages of all owners are sent at once.
+        Keys an owner rejects are read from their owners looked up again, if place_rejected is set.
+        """
+        values = {}
+        pending = {}
+        rejected = {}
+        successors = self.successor_lists(placements)
+        for owner, keys in placements.items():
+            values.update(dict.fromkeys(keys))
+            if owner is not None:
+                nodes = self.replica_set(owner, successors=successors[owner])
+                nodes.sort(key=lambda node: (self.latency_to(node), random.random()))
+                pending[owner] = (iter(nodes), keys)
+        while pending:
+            requests = []
+            for owner, (nodes, keys) in pending.items():
+                node = next((node for node in nodes if self.is_alive(node)), None)
+                if node is not None:
+                    requests.append((owner, node, keys))
+            responses = self.send_requests(
+                [
+                    (node, ApplicationLayerMessageTypes.FETCH_REQ, FetchPayload(keys, owner=node is owner))
+                    for owner, node, keys in requests
+                ]
+            )
+            missing = {}
+            for (owner, node, keys), response in zip(requests, responses):
+                if response is None:
+                    missing[owner] = (pending[owner][0], keys)
+                    continue
+                refused = set(response.rejected) if place_rejected else ()
+                if refused:
+                    # The rest of the replica set of an owner that is not responsible for the keys does not keep them either
+                    rejected[owner] = list(response.rejected)
+                for key, value in zip(keys, response.values):
+                    if key in refused:
+                        continue
+                    if value is None:
+                        missing.setdefault(owner, (pending[owner][0], []))[1].append(key)
+                    else:
+                        values[key] = value
+                        if node is not owner:
+                            self.metrics.increment("replica_reads")
+            pending = missing
+        if rejected:
+            values.update(self.read(self._place_rejected(rejected), place_rejected=False))
+        return values
+
+    def closest_preceding_finger(self, node_id):
+        node = self._entry_node()
+        if node is self:
+            return self._closest_preceding_finger(node_id)
+        step = self.send_request(
+            node,
+            ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ,
+            LookupPayload(node_id, self),
+        )
+        if step is None:
+            return None
+        return step.next_hop or step.predecessor
+
+    def _closest_preceding_finger(self, node_id, avoid=(), origin=None):
+        """
+        The live finger closest to node_id among the fingers preceding it.
+        With proximity route selection the prs_candidates closest such fingers are compared, see _route_cost.
+        """
+        self.metrics.increment("closest_preceding_finger")
+        finger_ids = self.finger_table.node_ids
+        candidates = []
+        for i in range(self.id_space.bits - 1, -1, -1):
+            if self.id_space.between(
+                finger_ids[i],
                 self.node_id,
                 node_id,
                 inclusive_left=False,
                 inclusive_right=False,
             ):
-                return self.finger_table.entries[i].node
+                finger = self.finger_table.finger(i)
+                if finger not in candidates and self.is_alive(finger, avoid):
+                    candidates.append(finger)
+                    if len(candidates) >= self.prs_candidates:
+                        break
+        if len(candidates) > 1:
+            return self._proximity_route(node_id, candidates, origin or self)
+        if candidates:
+            return candidates[0]
+        # Fall back to the successor list when every preceding finger is unreachable
+        for node in reversed(self.successor_list):
+            if self.id_space.between(
+                node.node_id,
+                self.node_id,
+                node_id,
+                inclusive_left=False,
+                inclusive_right=False,
+            ) and self.is_alive(node, avoid):
+                return node
         return self
 
     def init_finger_table(self):
-        succ_node = self.find_successor(self.finger_table.entries[0].start)
+        succ_node = None
+        try:
+            for contact in self.bootstrap_contacts():
+                if self.is_suspected(contact.node_id) or not self.contact(contact):
+                    continue
+                self.bootstrap_node = contact
+                succ_node = self.owner_of(self.finger_table.entries[0].start)
+                if succ_node is not None:
+                    break
+        finally:
+            self.bootstrap_node = None
+        if succ_node is None:
+            raise RuntimeError(f"{self} could not find its successor")
         self.finger_table.update(0, succ_node)
+        neighbours = self.neighbours_of(succ_node)
+        if neighbours is not None:
+            self.successor_list = self._successor_list_from(succ_node, neighbours.successor_list)
+        else:
+            self.successor_list = [succ_node]
 
         self.registry.add_component(self)
-        self.predecessor = succ_node.predecessor
-        succ_node.predecessor = self
-        self.predecessor.finger_table.update(0, self)
-        # succ_node.finger_table.entries[0].node = self
-        for i in range(SYSTEM_SIZE_BITS - 1):
-            if between(
+        self.joined = True
+        # The successor takes us as its predecessor and answers with its previous one,
+        # which takes us as its successor unless another node joined in between
+        previous = self.send_request(
+            succ_node, ApplicationLayerMessageTypes.SET_PREDECESSOR_REQ, PointerPayload(self)
+        )
+        with self.state_lock:
+            self.predecessor = previous.node if previous is not None else None
+        if self.predecessor is not None:
+            self.send_request(
+                self.predecessor,
+                ApplicationLayerMessageTypes.SET_SUCCESSOR_REQ,
+                PointerPayload(self, expected=succ_node),
+            )
+        for i in range(self.id_space.bits - 1):
+            if self.id_space.between(
                 self.finger_table.entries[i + 1].start,
                 self.node_id,
-                self.finger_table.entries[i].node.node_id,
+                self.finger_table.node_ids[i],
                 inclusive_left=True,
                 inclusive_right=False,
             ):
                 self.finger_table.entries[i + 1].node = self.finger_table.entries[i].node
             else:
                 node = self.find_successor(self.finger_table.entries[i + 1].start)
-                self.finger_table.update(i + 1, node)
+                if node is not None:
+                    self.finger_table.update(i + 1, node)
+
+    def connect(self, node):
+        """
+        Connects this node to a peer, unless they are connected already.
+        """
+        if node is None or node is self:
+            return
+        with self.peers_lock:
+            if node in self.peers:
+                return
+            self.peers.add(node)
+            self.P(node)
+
+    def disconnect(self, node):
+        with self.peers_lock:
+            if node in self.peers:
+                self.peers.discard(node)
+                self.connectors[ConnectorTypes.PEER].remove(node)
 
-    def make_peer(self, node):
-        self.P(node)
-        node.P(self)
+    def routing_neighbours(self):
+        """
+        The nodes this node routes to: its successor list, its predecessor and its fingers, O(log N) nodes.
+        """
+        neighbours = set(self.successor_list)
+        neighbours.update(self.finger_table.resolve(node_id) for node_id in set(self.finger_table.node_ids))
+        neighbours.add(self.predecessor)
+        neighbours.discard(None)
+        neighbours.discard(self)
+        return neighbours
+
+    def refresh_connections(self):
+        """
+        Connects to the routing neighbours and prunes the connections to nodes that are no longer one.
+        """
+        neighbours = self.routing_neighbours()
+        for node in list(self.peers - neighbours):
+            self.disconnect(node)
+        for node in neighbours:
+            self.connect(node)
 
     def join(self):
         if not self.registry.components:
             # If there are no components in the registry, add this component to the registry
             # Init the finger table for the Single node in the network
-            for i in range(SYSTEM_SIZE_BITS):
-                self.finger_table.entries[i].node = self
+            for entry in self.finger_table.entries:
+                entry.node = self
             self.predecessor = self
+            self.successor_list = [self]
             self.registry.add_component(self)
+            self.joined = True
+            self.start_maintenance()
+            report = MigrationReport()
         else:
-            # Connect the new node as peer to the every other node in the network
-            for node in self.registry.components.values():
-                self.make_peer(node)
             self.predecessor = None
             self.init_finger_table()
+            report = self.fetch_keys()
             self.update_other_nodes()
             self.stabilize()
-            self.fix_fingers()
+            if self.maintenance is None:
+                self.fix_fingers()
+            self.refresh_connections()
+            self.start_maintenance()
+        for node in self.virtual_nodes:
+            report.add(node.join())
+        return report
+
+    def fetch_keys(self):
+        """
+        Takes over the keys this node is now responsible for, (predecessor, self], from its successor in one bulk transfer.
+        The successor copies them and drops its copy once this node acknowledges them.
+        With replication it also copies the successor's replicas of the keys in front of it, and copies the keys it took
+        over to its own replica set.
+        """
+        started = time.perf_counter()
+        successor = self.successor()
+        if successor is self or self.predecessor is None:
+            return MigrationReport()
+        if successor.host is self.host:
+            # Virtual nodes of one host share its store, the keys are here already
+            return MigrationReport()
+        arc = KeyRangePayload(self.predecessor.node_id, self.node_id)
+        requests = [(successor, ApplicationLayerMessageTypes.KEY_TRANSFER_REQ, arc)]
+        if self.replicas > 0:
+            # This node now keeps replicas for the owners in front of it, which the successor kept so far
+            requests.append(
+                (successor, ApplicationLayerMessageTypes.REPLICA_TRANSFER_REQ, KeyRangePayload(self.node_id, self.predecessor.node_id))
+            )
+        responses = self.send_requests(requests, timeout=KEY_TRANSFER_TIMEOUT)
+        store = responses[0]
+        if self.replicas > 0:
+            if responses[1] is None:
+                logger.error(f"{self} could not copy the replicas of node {successor.node_id}")
+            else:
+                for key, value in responses[1].items:
+                    self.replica_store.put(key, value)
+        if store is None:
+            # The successor keeps the keys, nothing is lost
+            logger.error(f"{self} could not fetch its keys from node {successor.node_id}")
+            return MigrationReport()
+        self.store.merge(store)
+        self.send_message(successor, ApplicationLayerMessageTypes.KEY_TRANSFER_ACK, arc)
+        if self.replicas > 0 and len(store):
+            # The successor gave its copies up, so the replica set of this node gets the range anew
+            items = list(store.items())
+            self._replicate({node: items for node in self.replica_set(self)[1:]})
+        return self._record_migration(store, started)
+
+    def leave(self):
+        """
+        Gracefully leaves the ring.
+        All keys are handed over to the successor in one bulk transfer, the predecessor and the successor are linked
+        to each other and the node is removed from the registry. The virtual nodes it hosts leave first.
+        Returns a MigrationReport of the handover.
+        """
+        report = MigrationReport()
+        for node in self.virtual_nodes:
+            report.add(node.leave())
+        started = time.perf_counter()
+        if self.maintenance is not None:
+            self.maintenance.stop()
+        successor = self.live_successor()
+        if successor is not self:
+            store = self.keys_to_hand_over()
+            if self.send_request(successor, ApplicationLayerMessageTypes.KEY_HANDOFF_REQ, store) is None:
+                logger.error(f"{self} could not hand its keys over to node {successor.node_id}")
+                self.store.merge(store)
+            else:
+                report.add(self._record_migration(store, started))
+                if self.replicas > 0:
+                    self.hand_over_replicas(successor, store)
+            # Link the predecessor and the successor to each other, unless they already moved on
+            predecessor = self.predecessor
+            requests = [
+                (successor, ApplicationLayerMessageTypes.SET_PREDECESSOR_REQ, PointerPayload(predecessor, expected=self, departed=True))
+            ]
+            if predecessor is not None and predecessor is not self:
+                requests.append(
+                    (predecessor, ApplicationLayerMessageTypes.SET_SUCCESSOR_REQ, PointerPayload(successor, expected=self, departed=True))
+                )
+            self.send_requests(requests)
+        self.registry.remove_component(self)
+        for node in list(self.peers):
+            self.disconnect(node)
+        self.joined = False
+        self.alive = False
+        return report
+
+    def hand_over_replicas(self, successor, store):
+        """
+        Keeps the number of copies of the keys a leaving node had: the keys it owned, now handed over to successor in
+        store, and the replicas it kept for other owners are copied to the nodes that take its place in their
+        replica sets.
+        """
+        by_owner = {}
+        items = list(self.replica_store.items())
+        owners = self.owners_of(self.id_space.hash_key(key) for key, _ in items) if items else {}
+        for key, value in items:
+            owner = owners.get(self.id_space.hash_key(key))
+            if owner is not None and owner is not self:
+                by_owner.setdefault(owner, []).append((key, value))
+        successors = self.successor_lists([self, successor, *by_owner])
+        placements = [(successor, self.replica_set(self, successors=successors[self]), list(store.items()))]
+        placements += [
+            (owner, self.replica_set(owner, successors=successors[owner]), pairs) for owner, pairs in by_owner.items()
+        ]
+        by_replica = {}
+        for owner, kept_by, pairs in placements:
+            for node in self.replica_set(owner, without=self, successors=successors[owner]):
+                if node not in kept_by and node is not self:
+                    by_replica.setdefault(node, []).extend(pairs)
+        if not by_replica:
+            return
+        for node, payload, response in self._replicate(by_replica):
+            if response is None:
+                logger.error(f"{self} could not hand {len(payload.items)} replicas over to node {node.node_id}")
+
+    def keys_to_hand_over(self):
+        """
+        Removes and returns the keys a leaving node gives to its successor: all of them.
+        """
+        return self.store.split_range(self.node_id, self.node_id)
+
+    def _record_migration(self, store, started):
+        report = MigrationReport(len(store), store.bytes, time.perf_counter() - started)
+        self.metrics.increment("keys_migrated", report.keys)
+        self.metrics.increment("bytes_migrated", report.bytes)
+        return report
+
+    def start_maintenance(self):
+        if self.maintenance is not None:
+            self.maintenance.start()
 
     def update_other_nodes(self):
-        node = self.registry.get_arbitrary_component(
-            self.componentname, self.componentinstancenumber
-        )
-        for i in range(SYSTEM_SIZE_BITS):
-            p = node.find_predecessor((node.node_id - 2**i) % 2**SYSTEM_SIZE_BITS)
-            p.update_finger_table(node, i)
+        for i, offset in enumerate(self.id_space.finger_offsets):
+            p = self.find_predecessor((self.node_id - offset) % self.id_space.size)
+            if p is not None and p is not self:
+                self.send_message(p, ApplicationLayerMessageTypes.UPDATE_FINGER_TABLE, FingerUpdatePayload(self, i))
 
     def update_finger_table(self, s, i):
-        if between(
-            s.node_id,
-            self.node_id,
-            self.finger_table.entries[i].node.node_id,
-            inclusive_left=True,
-            inclusive_right=False,
-        ):
+        """
+        Handles UPDATE_FINGER_TABLE: takes s as the i-th finger if it is closer, and passes the update on to the predecessor.
+        """
+        with self.state_lock:
+            if not self.id_space.between(
+                s.node_id,
+                self.node_id,
+                self.finger_table.node_ids[i],
+                inclusive_left=True,
+                inclusive_right=False,
+            ):
+                return
             self.finger_table.update(i, s)
             p = self.predecessor
-            p.update_finger_table(s, i)
+        if p is not None and p is not s and p is not self:
+            self.send_message(p, ApplicationLayerMessageTypes.UPDATE_FINGER_TABLE, FingerUpdatePayload(s, i))
 
     def fix_fingers(self):
-        for node in self.registry.components.values():
-            for i in range(SYSTEM_SIZE_BITS):
-                node.finger_table.update(
-                    i, node.find_successor(node.finger_table.entries[i].start)
-                )
+        """
+        Refreshes every finger of every node in the registry. Each node updates its own finger table when it gets a
+        FIX_FINGERS_REQ, one node after the other so that the refreshes do not compete for the interpreter.
+        """
+        self.fix_all_fingers()
+        for node in list(self.registry.components.values()):
+            if node is not self:
+                self.send_request(node, ApplicationLayerMessageTypes.FIX_FINGERS_REQ, None, timeout=FIX_FINGERS_TIMEOUT)
+
+    def fix_all_fingers(self):
+        for i in range(self.id_space.bits):
+            self.fix_finger(i)
+        self.refresh_connections()
+
+    def _fix_fingers_and_reply(self, hdr):
+        try:
+            self.fix_all_fingers()
+        except Exception as e:
+            logger.error(f"{self} failed to fix its fingers: {e}")
+        resp = GenericMessage(
+            ApplicationLayerMessageHeader(
+                ApplicationLayerMessageTypes.FIX_FINGERS_RESP,
+                self,
+                hdr.messagefrom,
+                request_id=hdr.request_id,
+            ),
+            True,
+        )
+        self.send_to(hdr.messagefrom, resp)
+
+    def fix_finger(self, i):
+        """
+        Refreshes the i-th finger of this node only.
+        """
+        node = self.find_successor(self.finger_table.entries[i].start)
+        if node is not None:
+            self.finger_table.update(i, self.nearest_in_interval(i, node))
+
+    def latency_to(self, node):
+        """
+        Simulated one way latency from this node to another one, zero without a latency model.
+        """
+        model = self.registry.latency_model
+        if model is None:
+            return 0.0
+        return model.latency(self.host.node_id, node.host.node_id)
+
+    def _proximity_route(self, node_id, candidates, origin):
+        """
+        Proximity route selection: the candidate with the lowest estimated latency to node_id.
+        The estimate is the latency from origin, the node that sends the next request, to the candidate plus the hops still left from there, about half the bits of its
+        distance to node_id in units of the mean gap between nodes, times the mean latency to the candidates.
+        The gap is estimated from the span of the successor list.
+        """
+        size = self.id_space.size
+        successors = self.successor_list or [self.successor()]
+        gap = max(1, ((successors[-1].node_id - self.node_id) % size) / len(successors))
+        latencies = [origin.latency_to(node) for node in candidates]
+        mean_latency = sum(latencies) / len(latencies)
+
+        def cost(i):
+            distance = (node_id - candidates[i].node_id) % size
+            return latencies[i] + mean_latency * max(0.0, math.log2(max(1, distance / gap))) / 2
+
+        return candidates[min(range(len(candidates)), key=cost)]
+
+    def nearest_in_interval(self, i, node, successors=None):
+        """
+        Proximity neighbour selection: finger i may be any node in [start(i), start(i + 1)), not just the first one.
+        Given the first one, returns the lowest latency node among it and the following nodes of its successor list
+        that stay in the interval, at most pns_candidates of them. The successor, finger 0, is always exact.
+        successors is the successor list of node, node is asked for it if it is not given.
+        """
+        if self.pns_candidates <= 1 or i == 0:
+            return node
+        start = self.finger_table.start(i)
+        end = self.finger_table.start(i + 1) if i + 1 < self.id_space.bits else self.node_id
+        if not self.id_space.between(node.node_id, start, end, inclusive_left=True, inclusive_right=False):
+            # The interval is empty, the first node after it is the only candidate
+            return node
+        if successors is None:
+            neighbours = self.neighbours_of(node)
+            successors = [] if neighbours is None else neighbours.successor_list
+        candidates = [node]
+        for successor in successors[: self.pns_candidates - 1]:
+            if not self.id_space.between(
+                successor.node_id, start, end, inclusive_left=True, inclusive_right=False
+            ) or not self.is_alive(successor):
+                break
+            candidates.append(successor)
+        return min(candidates, key=self.latency_to)
 
     def stabilize(self):
-        x = self.successor().predecessor
-        if between(
+        """
+        Verifies the successor, adopts a node that joined in between, refreshes the successor list and notifies the successor.
+        A crashed successor is replaced by the next live node of the successor list, a crashed predecessor is forgotten.
+        """
+        self.check_predecessor()
+        successor = self.live_successor()
+        neighbours = self.neighbours_of(successor)
+        if neighbours is None:
+            # The successor did not answer and is suspected now, the next round moves on to the one after it
+            return
+        successors = self._successor_list_from(successor, neighbours.successor_list)
+        x = neighbours.predecessor
+        if x is not None and self.is_alive(x) and self.id_space.between(
             x.node_id,
             self.node_id,
-            self.successor().node_id,
+            successor.node_id,
             inclusive_left=False,
             inclusive_right=False,
         ):
-            self.finger_table.entries[0].node = x
-        self.successor().notify(self)
+            successors = self._successor_list_from(x, successors)
+        successor = successors[0]
+        with self.state_lock:
+            if successor is not self.successor():
+                self._invalidate_locations(self.successor())
+                self._invalidate_locations(successor)
+                self.finger_table.update(0, successor)
+            self.successor_list = successors
+        self.refresh_connections()
+        self.send_message(successor, ApplicationLayerMessageTypes.NOTIFY, NotifyPayload(self))
+
+    def check_predecessor(self):
+        """
+        Forgets the predecessor if it is suspected or does not answer, so that notify accepts a new one.
+        """
+        predecessor = self.predecessor
+        if predecessor is None or predecessor is self:
+            return
+        if self.is_alive(predecessor) and self.neighbours_of(predecessor) is not None:
+            return
+        with self.state_lock:
+            if self.predecessor is predecessor:
+                self._invalidate_locations(predecessor)
+                self.predecessor = None
+
+    def neighbours_of(self, node):
+        """
+        Asks node for its predecessor and successor list. Returns a NeighboursPayload, or None if node does not answer.
+        """
+        if node is self:
+            with self.state_lock:
+                return NeighboursPayload(self.predecessor, list(self.successor_list))
+        return self.send_request(node, ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ, None)
+
+    def _successor_list_from(self, successor, successor_list):
+        """
+        Our successor list: the successor followed by the first entries of its own successor list.
+        """
+        successors = [successor]
+        for node in successor_list:
+            if len(successors) >= self.successor_list_size or node is self:
+                break
+            successors.append(node)
+        return successors
 
     def notify(self, other_node):
-        if self.predecessor is None or between(
-            other_node.node_id,
-            self.predecessor.node_id,
-            self.node_id,
-            inclusive_left=False,
-            inclusive_right=False,
-        ):
+        """
+        Handles NOTIFY: other_node thinks it might be our predecessor.
+        """
+        with self.state_lock:
+            if self.predecessor is not None and not self.id_space.between(
+                other_node.node_id,
+                self.predecessor.node_id,
+                self.node_id,
+                inclusive_left=False,
+                inclusive_right=False,
+            ):
+                return
             self.predecessor = other_node
+        self._invalidate_locations(other_node)
+        self.connect(other_node)
 
-    def put(self, key):
+    def set_predecessor(self, node, expected=None):
         """
-        Stores a key in the distributed hash table.
-        The key is stored in the node that is responsible for the key.
+        Handles SET_PREDECESSOR_REQ: points the predecessor at node if it still points at expected, or in any case
+        when expected is None, and returns the previous predecessor.
         """
-        node = self.find_successor(key)
-        node.keys.add(key)
+        with self.state_lock:
+            previous = self.predecessor
+            if expected is not None and previous is not expected:
+                return previous
+            self.predecessor = node
+        self._invalidate_locations(previous)
+        self._invalidate_locations(node)
+        self.connect(node)
+        return previous
 
-    def get(self, key):
+    def set_successor(self, node, expected=None, departed=False):
+        """
+        Handles SET_SUCCESSOR_REQ: points the successor at node if it still points at expected, or in any case
+        when expected is None, and returns the previous successor. A departed expected node is also dropped from
+        the successor list.
+        """
+        with self.state_lock:
+            previous = self.successor()
+            successors = [n for n in self.successor_list if not (departed and n is expected)]
+            if expected is None or previous is expected:
+                self.finger_table.update(0, node)
+                successors = [node] + [n for n in successors if n is not node]
+            self.successor_list = successors[: self.successor_list_size] or [node]
+        self._invalidate_locations(previous)
+        self._invalidate_locations(node)
+        return previous
+
+    def _invalidate_locations(self, node):
+        """
+        Drops the cached locations a membership change of node made stale.
+        """
+        if self.location_cache is not None and node is not None:
+            self.location_cache.invalidate(node.node_id)
+
+    def accepts(self, key_id):
         """
-        The method finds the node that is responsible for the key and returns the key if it is stored in the node.
+        Whether this node is responsible for key_id as far as it knows, the check an owner makes before serving a key.
+        A node without a predecessor accepts every key, like a node whose predecessor crashed: the arc of the crashed
+        node is its own now. A predecessor that refuses the connection is forgotten, see check_predecessor.
         """
-        node = self.find_successor(key)
-        if key in node.keys:
-            return key
+        if not self.alive or not self.joined:
+            return False
+        predecessor = self.predecessor
+        if predecessor is None or predecessor is self or self.id_space.between(key_id, predecessor.node_id, self.node_id):
+            return True
+        if self.contact(predecessor):
+            return False
+        with self.state_lock:
+            if self.predecessor is predecessor:
+                self._invalidate_locations(predecessor)
+                self.predecessor = None
+        return True
+
+    def _cached_owner(self, key_id):
+        """
+        The owner of key_id in the location cache, or None. The request then goes straight to the owner, a lookup of
+        one hop, and the owner rejects the key if it is no longer responsible for it, see _place_rejected.
+        A cached owner that refuses the connection because it left or crashed is forgotten.
+        """
+        if self.location_cache is None:
+            return None
+        started = time.perf_counter()
+        node = self.location_cache.get(key_id)
+        if node is None:
+            return None
+        if not self.contact(node):
+            self.location_cache.invalidate(node.node_id)
+            return None
+        simulated_latency = None if self.registry.latency_model is None else self.latency_to(node)
+        self.metrics.record_lookup(1, time.perf_counter() - started, simulated_latency)
+        return node
+
+    def owner_of(self, key_id):
+        """
+        Returns the node responsible for key_id, straight from the location cache if it is enabled and holds
+        its arc, with a lookup otherwise.
+        The last hop of a lookup may not have noticed yet that its successor crashed, so the owner is contacted,
+        and looked up again around it if it refuses.
+        """
+        node = self._cached_owner(key_id)
+        if node is not None:
+            return node
+        for _ in range(self.successor_list_size + 1):
+            result = self.lookup(key_id)
+            if result is None:
+                return None
+            if self.contact(result.successor):
+                break
         else:
             return None
+        if self.location_cache is not None:
+            self.location_cache.put(result.predecessor.node_id, result.successor)
+        return result.successor
+
+    def owners_of(self, key_ids):
+        """
+        owner_of for many identifiers: the ones the location cache cannot answer are resolved with one find_successors batch.
+        """
+        owners = {}
+        missing = []
+        for key_id in set(key_ids):
+            node = self._cached_owner(key_id)
+            if node is None:
+                missing.append(key_id)
+            else:
+                owners[key_id] = node
+        if missing:
+            owners.update(self.find_successors(missing))
+        refused = {node for node in set(owners.values()) if node is not None and not self.contact(node)}
+        if refused:
+            for key_id, node in owners.items():
+                if node in refused:
+                    owners[key_id] = self.owner_of(key_id)
+        return owners
+
+    def put(self, key, value=b""):
+        """
+        Stores a key and its value in the distributed hash table.
+        The key can be an identifier, a string or bytes, it is hashed onto the ring and
+        stored in the node that is responsible for the hashed identifier. The value is bytes or a string.
+        With replication the key is also copied to the next replicas successors, see write.
+        Returns False if the write did not reach the write quorum.
+        """
+        node = self.owner_of(self.id_space.hash_key(key))
+        return not self.write({node: [(key, value)]})
+
+    def get(self, key):
+        """
+        The method finds the node that is responsible for the key and returns its value, or None if the key is not stored.
+        With replication the value is read from the nearest copy, see read.
+        """
+        return self.read({self.owner_of(self.id_space.hash_key(key)): [key]})[key]
+
+
+class VirtualChordComponent(ChordComponent):
+    """
+    A virtual node: one more identifier of the ring hosted by a physical ChordComponent.
+
+    With several identifiers per physical node the key load of a physical node is the sum of several arcs,
+    which evens out the load that a single identifier gets from the random gaps between identifiers.
+    A virtual node has its own finger table, successor list and predecessor, but no worker threads:
+    messages to it are queued to its host, whose workers hand them over, and it stores its keys in the store of its host.
+    """
+
+    def __init__(self, host, node_id, configuration_parameters=None):
+        super().__init__(
+            host.componentname,
+            node_id,
+            host.context,
+            configuration_parameters,
+            num_worker_threads=0,
+            topology=host.topology,
+        )
+        self.host = host
+        self.store = host.store
+        self.replica_store = host.replica_store
+        self.coalescer = host.coalescer
+
+    def trigger_event(self, eventobj: Event):
+        if eventobj.event == EventTypes.MFRP:
+            self.host.trigger_event(eventobj)
+        else:
+            # No worker threads, lifecycle events are handled right away
+            self.eventhandlers[eventobj.event](eventobj=eventobj)
+
+    def keys_to_hand_over(self):
+        """
+        Only the arc of this virtual node leaves, the rest of the shared store belongs to the host and its other virtual nodes.
+        """
+        if self.predecessor is None:
+            return KeyValueStore(self.id_space)
+        return self.store.split_range(self.predecessor.node_id, self.node_id)
+
+
+def bootstrap_ring(nodes):
+    """
+    Builds a ring from a known set of nodes without running the join protocol.
+
+    The nodes are indexed by node_id in the registry once, then the predecessor and every finger of every node
+    are found with the registry's O(log N) successor_of and predecessor_of queries, which takes O(N log N) for N nodes
+    instead of the message exchanges and global finger fixing of N consecutive joins.
+    Each node is connected as a peer to the nodes it routes to, see refresh_connections. The virtual nodes of the given nodes join the ring with them.
+    """
+    registry = ComponentRegistry()
+    if registry.components:
+        raise ValueError("A ring can only be bootstrapped into an empty registry")
+    nodes = [ring_node for node in nodes for ring_node in (node, *node.virtual_nodes)]
+    if len({node.node_id for node in nodes}) != len(nodes):
+        raise ValueError("Node identifiers of a ring must be unique")
+    for node in nodes:
+        registry.add_component(node)
+    ordered = sorted(nodes, key=lambda node: node.node_id)
+    for i, node in enumerate(ordered):
+        count = min(node.successor_list_size, len(ordered) - 1)
+        node.successor_list = [ordered[(i + k) % len(ordered)] for k in range(1, count + 1)] or [node]
+    if vectorized.AVAILABLE:
+        # Resolve the fingers of all nodes with a single sorted search
+        sorted_ids = vectorized.as_ids([node.node_id for node in ordered], registry.id_space)
+        indices = vectorized.successor_indices(sorted_ids, vectorized.finger_targets(sorted_ids, registry.id_space))
+        for i, (node, row) in enumerate(zip(ordered, sorted_ids[indices].tolist())):
+            node.predecessor = ordered[i - 1]
+            node.finger_table.assign(row)
+    else:
+        for node in nodes:
+            node.predecessor = registry.predecessor_of(node.node_id)
+            node.finger_table.assign(
+                registry.successor_of(start).node_id for start in registry.id_space.finger_starts(node.node_id)
+            )
+    for node in nodes:
+        if node.pns_candidates > 1:
+            for i in range(1, registry.id_space.bits):
+                finger = node.finger_table.finger(i)
+                node.finger_table.update(i, node.nearest_in_interval(i, finger, finger.successor_list))
+    for node in nodes:
+        node.joined = True
+        node.start_maintenance()
+        node.refresh_connections()
+    return nodes
 
 
 class Node(GenericModel):
@@ -396,33 +2091,40 @@ class Node(GenericModel):
             topology,
         )
         # SUBCOMPONENTS
+        registry = ComponentRegistry()
+        if configurationparameters and "system_size_bits" in configurationparameters:
+            registry.configure_id_space(configurationparameters["system_size_bits"])
+        id_space = registry.id_space
         network = {}
-        for i in range(2**SYSTEM_SIZE_BITS-1):
+        for i in range(id_space.size - 1):
             node_id = i
             node = ChordComponent(componentname="Node", componentinstancenumber=node_id)
             network[node_id] = node
             self.components.append(node)
 
-        for node in network.values():
-            node.join()
-            print(f"Node {node.node_id} has joined")
+        if configurationparameters and configurationparameters.get("bootstrap"):
+            bootstrap_ring(network.values())
+        else:
+            for node in network.values():
+                node.join()
+                print(f"Node {node.node_id} has joined")
 
-        keys = [i for i in range(2**SYSTEM_SIZE_BITS)]
-        path_lengths = []
-        for key in keys:
-            node.put(key)
+        keys = [i for i in range(id_space.size)]
+        self.path_lengths = []
+        node.put_many(keys)
         for key in keys:
-            node.registry.find_successor = 0
-            node.registry.find_predecessor = 0
-            node.registry.closest_preceding_finger = 0
-            node.find_successor(key)
-            path_lengths.append(node.registry.find_successor + node.registry.find_predecessor + node.registry.closest_preceding_finger)
-        plt.hist(path_lengths, density=True, bins=SYSTEM_SIZE_BITS)  # 'auto' will automatically determine the number of bins
-        plt.title("Histogram of Path Lengths")
-        plt.xlabel("Path Length")
-        plt.ylabel("Frequency")
-        plt.show()
-        pass
+            # Path length is the number of messages the lookup sent along the finger path
+            self.path_lengths.append(node.lookup(key).hops)
+
+
+def plot_path_lengths(path_lengths, bins):
+    # matplotlib is only needed for the plot, so it is not imported with the component
+    import matplotlib.pyplot as plt
+    plt.hist(path_lengths, density=True, bins=bins)  # 'auto' will automatically determine the number of bins
+    plt.title("Histogram of Path Lengths")
+    plt.xlabel("Path Length")
+    plt.ylabel("Frequency")
+    plt.show()
 
 
 def main():
@@ -432,6 +2134,7 @@ def main():
     topo.start()
     time.sleep(1)
     topo.exit()
+    plot_path_lengths(topo.singlenode.path_lengths, ComponentRegistry().id_space.bits)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,333 @@
+"""
+Churn workload driver for ChordComponent rings.
+
+Builds a ring with periodic maintenance, then for a fixed duration lets nodes join, leave gracefully and crash
+as Poisson processes with the given rates while lookup threads keep issuing lookups from random live nodes.
+Every window seconds it reports the membership changes, the lookup success rate (a lookup succeeds when it returns
+the live successor of its key), the mean and percentile hop counts and latencies, and the messages sent by
+the maintenance tasks next to all messages sent, for example:
+
+    python chord/churn.py --size 64 --bits 16 --duration 30 --join-rate 1 --leave-rate 0.5 --crash-rate 0.5 \\
+        --stabilize-interval 0.5 --format csv --output churn.csv
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from adhoccomputing.Generics import *
+from benchmark import random_node_ids, shutdown, write_results
+from chord_component import ChordComponent, RoutingModes, bootstrap_ring
+from component_registry import ComponentRegistry
+from maintenance import STABILIZE_INTERVAL, FIX_FINGERS_INTERVAL
+from metrics import LatencyHistogram, hop_percentile
+
+FIELDS = [
+    "time",
+    "nodes",
+    "joins",
+    "leaves",
+    "crashes",
+    "failed_joins",
+    "lookups",
+    "successful_lookups",
+    "wrong_lookups",
+    "failed_lookups",
+    "success_rate",
+    "mean_hops",
+    "p50_hops",
+    "p99_hops",
+    "p50_latency",
+    "p99_latency",
+    "maintenance_messages",
+    "messages_sent",
+    "maintenance_share",
+    "timeouts",
+    "send_failures",
+]
+
+
+class ChurnWindow:
+    """
+    What happened during one reporting window.
+    """
+
+    def __init__(self):
+        self.events = Counter()
+        self.lookups = Counter()
+        self.hops = Counter()
+        self.latency = LatencyHistogram()
+
+
+class ChurnSimulator:
+    """
+    Runs a churn scenario on a ring of size nodes in a bits wide identifier space.
+
+    The simulator keeps its own sorted index of the live members: crashed nodes stay in the ComponentRegistry,
+    as nobody told the ring about them, so the registry cannot tell which node should answer a lookup.
+    """
+
+    def __init__(
+        self,
+        size=64,
+        bits=16,
+        duration=30.0,
+        window=1.0,
+        join_rate=1.0,
+        leave_rate=0.5,
+        crash_rate=0.5,
+        lookup_threads=4,
+        stabilize_interval=STABILIZE_INTERVAL,
+        fix_fingers_interval=FIX_FINGERS_INTERVAL,
+        routing_mode=RoutingModes.ITERATIVE,
+        min_size=2,
+        seed=0,
+    ):
+        if size > 2**bits:
+            raise ValueError(f"A {bits} bit identifier space cannot hold {size} nodes")
+        self.size = size
+        self.bits = bits
+        self.duration = duration
+        self.window = window
+        self.join_rate = join_rate
+        self.leave_rate = leave_rate
+        self.crash_rate = crash_rate
+        self.lookup_threads = lookup_threads
+        self.routing_mode = RoutingModes(routing_mode)
+        self.min_size = min_size
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.params = {
+            "routing_mode": self.routing_mode,
+            "stabilize_interval": stabilize_interval,
+            "fix_fingers_interval": fix_fingers_interval,
+        }
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.registry = ComponentRegistry()
+        self.nodes = []
+        self.member_ids = []
+        self.members = {}
+        self.current = ChurnWindow()
+
+    def create_node(self, node_id):
+        params = dict(self.params, seed=self.random.getrandbits(32))
+        node = ChordComponent("Node", node_id, configuration_parameters=params)
+        self.nodes.append(node)
+        return node
+
+    def add_member(self, node):
+        with self.lock:
+            insort(self.member_ids, node.node_id)
+            self.members[node.node_id] = node
+
+    def remove_member(self, node):
+        with self.lock:
+            del self.member_ids[bisect_left(self.member_ids, node.node_id)]
+            del self.members[node.node_id]
+
+    def owner_of(self, key):
+        with self.lock:
+            return self.members[self.member_ids[bisect_left(self.member_ids, key) % len(self.member_ids)]]
+
+    def random_member(self, rng):
+        with self.lock:
+            return self.members[rng.choice(self.member_ids)]
+
+    def build(self):
+        self.registry.clear()
+        self.registry.configure_id_space(self.bits)
+        nodes = [self.create_node(node_id) for node_id in random_node_ids(self.random, self.size, self.bits)]
+        bootstrap_ring(nodes)
+        for node in nodes:
+            self.add_member(node)
+
+    def record(self, name, amount=1):
+        with self.lock:
+            self.current.events[name] += amount
+
+    def join(self):
+        node_id = self.random.getrandbits(self.bits)
+        if self.registry.get_node(node_id) is not None:
+            return
+        node = self.create_node(node_id)
+        try:
+            node.join()
+        except Exception as e:
+            logger.error(f"Join of node {node_id} failed: {e}")
+            node.crash()
+            self.registry.remove_component(node)
+            self.record("failed_joins")
+            return
+        self.add_member(node)
+        self.record("joins")
+
+    def leave(self):
+        node = self.random_member(self.random)
+        self.remove_member(node)
+        node.leave()
+        self.record("leaves")
+
+    def crash(self):
+        node = self.random_member(self.random)
+        self.remove_member(node)
+        node.crash()
+        self.record("crashes")
+
+    def run_churn(self):
+        """
+        Draws membership events from Poisson processes with the configured rates until the simulation stops.
+        """
+        events = [(self.join, self.join_rate), (self.leave, self.leave_rate), (self.crash, self.crash_rate)]
+        events = [(event, rate) for event, rate in events if rate > 0]
+        total_rate = sum(rate for _, rate in events)
+        if not events:
+            return
+        while not self.stopped.wait(self.random.expovariate(total_rate)):
+            event = self.random.choices([event for event, _ in events], [rate for _, rate in events])[0]
+            if event is not self.join and len(self.member_ids) <= self.min_size:
+                continue
+            try:
+                event()
+            except Exception as e:
+                logger.error(f"Churn event {event.__name__} failed: {e}")
+
+    def run_lookups(self, seed):
+        rng = random.Random(seed)
+        while not self.stopped.is_set():
+            node = self.random_member(rng)
+            key = rng.getrandbits(self.bits)
+            started = time.perf_counter()
+            result = node.lookup(key)
+            latency = time.perf_counter() - started
+            expected = self.owner_of(key)
+            with self.lock:
+                window = self.current
+                if result is None:
+                    window.lookups["failed"] += 1
+                elif result.successor is not expected:
+                    window.lookups["wrong"] += 1
+                else:
+                    window.lookups["successful"] += 1
+                    window.hops[result.hops] += 1
+                    window.latency.record(latency)
+
+    def message_counts(self):
+        counts = Counter()
+        for node in self.nodes:
+            with node.metrics.lock:
+                counts["maintenance_messages"] += node.metrics.counters["maintenance_messages"]
+                counts["messages_sent"] += node.metrics.counters["messages_sent"]
+                counts["timeouts"] += node.metrics.counters["timeouts"]
+                counts["send_failures"] += node.metrics.counters["send_failures"]
+        return counts
+
+    def close_window(self, elapsed, messages):
+        with self.lock:
+            window, self.current = self.current, ChurnWindow()
+            nodes = len(self.member_ids)
+        lookups = sum(window.lookups.values())
+        successful = window.lookups["successful"]
+        return {
+            "time": round(elapsed, 3),
+            "nodes": nodes,
+            "joins": window.events["joins"],
+            "leaves": window.events["leaves"],
+            "crashes": window.events["crashes"],
+            "failed_joins": window.events["failed_joins"],
+            "lookups": lookups,
+            "successful_lookups": successful,
+            "wrong_lookups": window.lookups["wrong"],
+            "failed_lookups": window.lookups["failed"],
+            "success_rate": successful / lookups if lookups else None,
+            "mean_hops": sum(h * n for h, n in window.hops.items()) / successful if successful else None,
+            "p50_hops": hop_percentile(window.hops, 50),
+            "p99_hops": hop_percentile(window.hops, 99),
+            "p50_latency": window.latency.percentile(50),
+            "p99_latency": window.latency.percentile(99),
+            "maintenance_messages": messages["maintenance_messages"],
+            "messages_sent": messages["messages_sent"],
+            "maintenance_share": messages["maintenance_messages"] / messages["messages_sent"] if messages["messages_sent"] else None,
+            "timeouts": messages["timeouts"],
+            "send_failures": messages["send_failures"],
+        }
+
+    def run(self):
+        """
+        Builds the ring, runs the scenario and returns one report row per window.
+        """
+        self.build()
+        threads = [threading.Thread(target=self.run_churn, daemon=True)]
+        threads += [
+            threading.Thread(target=self.run_lookups, args=(self.random.getrandbits(32),), daemon=True)
+            for _ in range(self.lookup_threads)
+        ]
+        results = []
+        previous = self.message_counts()
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                elapsed = time.monotonic() - started
+                if elapsed >= self.duration:
+                    break
+                time.sleep(min(self.window, self.duration - elapsed))
+                counts = self.message_counts()
+                counts.subtract(previous)
+                previous += counts
+                results.append(self.close_window(time.monotonic() - started, counts))
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+            shutdown(self.nodes)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a churn workload on a ChordComponent ring")
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--bits", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--window", type=float, default=1.0, help="seconds per report row")
+    parser.add_argument("--join-rate", type=float, default=1.0, help="joins per second")
+    parser.add_argument("--leave-rate", type=float, default=0.5, help="graceful leaves per second")
+    parser.add_argument("--crash-rate", type=float, default=0.5, help="crashes per second")
+    parser.add_argument("--lookup-threads", type=int, default=4)
+    parser.add_argument("--stabilize-interval", type=float, default=STABILIZE_INTERVAL)
+    parser.add_argument("--fix-fingers-interval", type=float, default=FIX_FINGERS_INTERVAL)
+    parser.add_argument("--routing-mode", choices=[mode.value for mode in RoutingModes], default=RoutingModes.ITERATIVE.value)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", help="file to write the results to, standard output by default")
+    args = parser.parse_args(argv)
+
+    setAHCLogLevel(ERROR)
+    simulator = ChurnSimulator(
+        size=args.size,
+        bits=args.bits,
+        duration=args.duration,
+        window=args.window,
+        join_rate=args.join_rate,
+        leave_rate=args.leave_rate,
+        crash_rate=args.crash_rate,
+        lookup_threads=args.lookup_threads,
+        stabilize_interval=args.stabilize_interval,
+        fix_fingers_interval=args.fix_fingers_interval,
+        routing_mode=args.routing_mode,
+        seed=args.seed,
+    )
+    results = simulator.run()
+    if args.output:
+        with open(args.output, "w", newline="") as fp:
+            write_results(results, fp, args.format, FIELDS)
+    else:
+        write_results(results, sys.stdout, args.format, FIELDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import threading
+import time
+from adhoccomputing.Generics import logger
+
+# Default seconds a message may wait for others to the same destination, and the most messages in a batch
+COALESCE_WINDOW = 0.001
+COALESCE_MAX_MESSAGES = 64
+
+
+class OutboundCoalescer:
+    """
+    Coalesces outbound messages per destination.
+
+    Messages to the same destination are buffered until window seconds passed since the first of them or
+    max_messages are waiting, whichever comes first, and are then handed to deliver(destination, messages) together,
+    so they cost a single event instead of one each. A full batch is delivered right away by the sending thread,
+    batches that run out of time are delivered by a background thread.
+
+    If busy(destination) is given, a message to a destination that is not busy and has nothing buffered is
+    delivered right away, as a batch of one: like Nagle's algorithm, messages only wait while the destination
+    would not get to them immediately anyway, so coalescing adds no latency under light load. A buffer is also
+    delivered early when another message for its destination finds the destination idle.
+    """
+
+    def __init__(self, deliver, window=COALESCE_WINDOW, max_messages=COALESCE_MAX_MESSAGES, busy=None):
+        self.deliver = deliver
+        self.busy = busy
+        self.window = window
+        self.max_messages = max_messages
+        self.buffers = {}
+        self.deadlines = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.batches = 0
+        self.messages = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, destination, message):
+        with self.condition:
+            buffer = self.buffers.get(destination)
+            if buffer is None:
+                if self.busy is not None and not self.busy(destination):
+                    self.batches += 1
+                    self.messages += 1
+                    batch = [message]
+                else:
+                    self.buffers[destination] = [message]
+                    self.deadlines[destination] = time.monotonic() + self.window
+                    self.condition.notify()
+                    return
+            else:
+                buffer.append(message)
+                if len(buffer) < self.max_messages and (self.busy is None or self.busy(destination)):
+                    return
+                batch = self._take(destination)
+        self._deliver(destination, batch)
+
+    def _take(self, destination):
+        del self.deadlines[destination]
+        batch = self.buffers.pop(destination)
+        self.batches += 1
+        self.messages += len(batch)
+        return batch
+
+    def _deliver(self, destination, batch):
+        try:
+            self.deliver(destination, batch)
+        except Exception as e:
+            logger.error(f"Delivering a batch of {len(batch)} messages to {destination} failed: {e}")
+
+    def flush(self):
+        """
+        Delivers every buffered message now.
+        """
+        with self.condition:
+            batches = [(destination, self._take(destination)) for destination in list(self.buffers)]
+        for destination, batch in batches:
+            self._deliver(destination, batch)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.flush()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    now = time.monotonic()
+                    due = [destination for destination, deadline in self.deadlines.items() if deadline <= now]
+                    if due:
+                        break
+                    self.condition.wait(min(self.deadlines.values()) - now if self.deadlines else None)
+                if self.stopped:
+                    return
+                batches = [(destination, self._take(destination)) for destination in due]
+            for destination, batch in batches:
+                self._deliver(destination, batch)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "batches": self.batches,
+                "messages": self.messages,
+                "messages_per_batch": self.messages / self.batches if self.batches else None,
+            }
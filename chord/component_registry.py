@@ -1,4 +1,7 @@
+import threading
+from bisect import bisect_left, insort
 from adhoccomputing.Generics import Event, EventTypes
+from identifier_space import IdentifierSpace
 
 
 def singleton(cls):
@@ -12,34 +15,120 @@ def singleton(cls):
 
 @singleton
 class ComponentRegistry:
-    """A singleton class that maintains a registry of components."""
+    """
+    A singleton class that maintains a registry of components.
+
+    Components are keyed by (componentname, componentinstancenumber). Components that are ring members
+    (they have a node_id) are also kept in a sorted index of node identifiers, which answers
+    successor_of and predecessor_of in O(log N) and serves as a ground truth oracle for the ring.
+    """
 
     components = {}
-    find_successor = 0
-    find_predecessor = 0
-    closest_preceding_finger = 0
+    component_keys = {}
+    node_ids = []
+    nodes_by_id = {}
+    lock = threading.Lock()
+    id_space = IdentifierSpace()
+    latency_model = None
+    resolver = None
+
+    def configure_id_space(self, bits):
+        """
+        Sets the number of identifier bits used by the ring.
+        The identifier space is shared by every node, so it can only be changed while the ring is empty.
+        """
+        if self.components and bits != self.id_space.bits:
+            raise ValueError("Cannot change the identifier space of a ring that already has nodes")
+        self.id_space = IdentifierSpace(bits)
+        return self.id_space
+
+    def set_latency_model(self, model):
+        """
+        Sets the LatencyModel of the simulated network, or None for a network without link latencies.
+        """
+        self.latency_model = model
+        return model
+
+    def set_resolver(self, resolver):
+        """
+        Sets a function that returns the node for an identifier that is not registered here, such as a node hosted
+        by another process of a sharded ring, or None to resolve registered nodes only.
+        """
+        self.resolver = resolver
+        return resolver
 
     def get_component_by_instance(self, instance):
-        list_of_keys = list()
-        list_of_items = self.components.items()
-        for item in list_of_items:
-            if item[1] == instance:
-                list_of_keys.append(item[0])
-        return list_of_keys
+        key = self.component_keys.get(instance)
+        return [key] if key is not None else []
 
     def add_component(self, component):
-        key = component.componentname + str(component.componentinstancenumber)
-        self.components[key] = component
+        key = (component.componentname, component.componentinstancenumber)
+        with self.lock:
+            self.components[key] = component
+            self.component_keys[component] = key
+            node_id = getattr(component, "node_id", None)
+            if node_id is not None and node_id not in self.nodes_by_id:
+                insort(self.node_ids, node_id)
+            if node_id is not None:
+                self.nodes_by_id[node_id] = component
+
+    def remove_component(self, component):
+        with self.lock:
+            key = self.component_keys.pop(component, None)
+            if key is None:
+                return
+            del self.components[key]
+            node_id = getattr(component, "node_id", None)
+            if node_id is not None and self.nodes_by_id.get(node_id) is component:
+                del self.nodes_by_id[node_id]
+                del self.node_ids[bisect_left(self.node_ids, node_id)]
+
+    def clear(self):
+        """
+        Empties the registry so a new ring can be built, e.g. between benchmark runs.
+        """
+        with self.lock:
+            self.components.clear()
+            self.component_keys.clear()
+            self.nodes_by_id.clear()
+            del self.node_ids[:]
 
     def get_component_by_key(self, component_name, component_instance_number):
-        key = component_name + str(component_instance_number)
-        return self.components.get(key)
+        return self.components.get((component_name, component_instance_number))
+
+    def get_node(self, node_id):
+        node = self.nodes_by_id.get(node_id)
+        if node is None and self.resolver is not None:
+            node = self.resolver(node_id)
+        return node
+
+    def successor_of(self, node_id):
+        """
+        Returns the first registered node whose identifier is equal to or follows node_id on the ring.
+        """
+        node_ids = self.node_ids
+        if not node_ids:
+            return None
+        return self.nodes_by_id[node_ids[bisect_left(node_ids, node_id) % len(node_ids)]]
+
+    def predecessor_of(self, node_id):
+        """
+        Returns the last registered node whose identifier strictly precedes node_id on the ring.
+        """
+        node_ids = self.node_ids
+        if not node_ids:
+            return None
+        return self.nodes_by_id[node_ids[bisect_left(node_ids, node_id) - 1]]
 
     def get_arbitrary_component(self, componentname, componentinstancenumber):
-        # Return the first component in the registry that is not the same as the one specified
+        # Return a registered component other than the one specified: the ring member following
+        # its identifier, which makes a good bootstrap contact for a joining node
         if len(self.components) == 1:
-            return list(self.components.values())[0]
-        key = componentname + str(componentinstancenumber)
+            return next(iter(self.components.values()))
+        key = (componentname, componentinstancenumber)
+        node = self.successor_of((componentinstancenumber + 1) % self.id_space.size)
+        if node is not None and self.component_keys.get(node) != key:
+            return node
         for k, v in self.components.items():
             if k != key:
                 return v
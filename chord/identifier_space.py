@@ -0,0 +1,63 @@
+import hashlib
+
+DEFAULT_SYSTEM_SIZE_BITS = 7
+# SHA-1 digests are 160 bits long, so this is the widest identifier space keys can be hashed into.
+MAX_SYSTEM_SIZE_BITS = 160
+
+
+def between(_id: int, left: int, right: int, ring_sz: int, inclusive_left=False, inclusive_right=True) -> bool:
+    """
+    This code is taken from https://github.com/melzareix/chord-dht/blob/master/src/chord/helpers.py#L33-L46
+    Check if _id lies between left and right in a circular ring of size ring_sz.
+    """
+    if left != right:
+        if inclusive_left:
+            left = (left - 1 + ring_sz) % ring_sz
+        if inclusive_right:
+            right = (right + 1) % ring_sz
+    if left < right:
+        return left < _id < right
+    else:
+        return (_id > max(left, right)) or (_id < min(left, right))
+
+
+class IdentifierSpace:
+    """
+    The circular identifier space of a Chord ring.
+
+    The ring modulus and the finger offsets are computed once when the space is created,
+    so interval checks and finger tables do not recompute powers of two on every call.
+    Arbitrary byte and string keys are mapped onto the ring with SHA-1, truncated to the configured number of bits.
+    """
+
+    def __init__(self, bits=DEFAULT_SYSTEM_SIZE_BITS):
+        if not 1 <= bits <= MAX_SYSTEM_SIZE_BITS:
+            raise ValueError(f"Identifier space must have between 1 and {MAX_SYSTEM_SIZE_BITS} bits, got {bits}")
+        self.bits = bits
+        self.size = 2**bits
+        self.finger_offsets = tuple(2**i for i in range(bits))
+        self._digest_shift = MAX_SYSTEM_SIZE_BITS - bits
+
+    def __repr__(self):
+        return f"IdentifierSpace(bits={self.bits})"
+
+    def finger_starts(self, node_id):
+        """
+        Returns the start of every finger interval of node_id, i.e. (node_id + 2^i) mod 2^m.
+        """
+        return [(node_id + offset) % self.size for offset in self.finger_offsets]
+
+    def between(self, _id, left, right, inclusive_left=False, inclusive_right=True):
+        return between(_id, left, right, self.size, inclusive_left, inclusive_right)
+
+    def hash_key(self, key):
+        """
+        Maps a key onto the ring.
+        Integers are treated as identifiers already, bytes and strings are hashed with SHA-1.
+        """
+        if isinstance(key, int):
+            return key % self.size
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        digest = hashlib.sha1(bytes(key)).digest()
+        return int.from_bytes(digest, "big") >> self._digest_shift
@@ -0,0 +1,77 @@
+"""
+Link latency models of the simulated network.
+
+A model answers latency(a, b), the one way delay in seconds between the physical nodes with identifiers a and b.
+The ring shares one model through ComponentRegistry.set_latency_model. Nodes use it to pick nearby fingers and next hops
+and to add up the simulated latency of every lookup; messages are not actually delayed.
+"""
+
+import math
+import random
+
+
+class LatencyModel:
+    """
+    Every link has the same latency, zero by default.
+    """
+
+    def __init__(self, latency=0.0):
+        self.default = latency
+
+    def latency(self, a, b):
+        return 0.0 if a == b else self.default
+
+
+class MatrixLatency(LatencyModel):
+    """
+    Latencies from a matrix, given as a mapping from node identifier to a mapping from node identifier to seconds,
+    such as a dict of dicts or a list of lists for identifiers 0..n-1. A missing a -> b entry falls back to b -> a,
+    then to default.
+    """
+
+    def __init__(self, matrix, default=0.0):
+        super().__init__(default)
+        self.matrix = matrix
+
+    def _lookup(self, a, b):
+        try:
+            return self.matrix[a][b]
+        except (KeyError, IndexError):
+            return None
+
+    def latency(self, a, b):
+        if a == b:
+            return 0.0
+        latency = self._lookup(a, b)
+        if latency is None:
+            latency = self._lookup(b, a)
+        return self.default if latency is None else latency
+
+
+class CoordinateLatency(LatencyModel):
+    """
+    Latency proportional to the euclidean distance between network coordinates of the nodes, as in Vivaldi.
+
+    Nodes without given coordinates get random ones in the unit cube of the given dimensions, drawn from a generator
+    seeded with the seed and the node identifier, so a node keeps its place across runs. scale is the latency in
+    seconds of a unit distance, base is added to every link.
+    """
+
+    def __init__(self, coordinates=None, dimensions=2, scale=0.1, base=0.0, seed=0):
+        super().__init__(base)
+        self.coordinates = dict(coordinates or {})
+        self.dimensions = dimensions
+        self.scale = scale
+        self.seed = seed
+
+    def coordinate(self, node_id):
+        coordinate = self.coordinates.get(node_id)
+        if coordinate is None:
+            rng = random.Random(f"{self.seed}-{node_id}")
+            coordinate = self.coordinates[node_id] = tuple(rng.random() for _ in range(self.dimensions))
+        return coordinate
+
+    def latency(self, a, b):
+        if a == b:
+            return 0.0
+        return self.default + self.scale * math.dist(self.coordinate(a), self.coordinate(b))
@@ -0,0 +1,111 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+# Default number of cached ranges per node, and seconds a cached range stays valid
+LOCATION_CACHE_SIZE = 1024
+LOCATION_CACHE_TTL = 30.0
+
+
+class LocationCache:
+    """
+    Caches which node owns a range of identifiers, as learnt from earlier lookups.
+
+    A lookup that ends at a predecessor p and a successor s shows that s owns the arc (p, s], so every later key
+    in that arc can go to s without walking the finger path again. Entries are keyed by the identifier of the owner,
+    the right end of their arc: a sorted list of these identifiers finds the arc of a key with one bisection, and
+    an OrderedDict keeps them in least recently used order. At most capacity entries are kept and an entry expires
+    ttl seconds after it was added. The cache is shared by the lookups of a node, so it is guarded by a lock.
+    """
+
+    def __init__(self, id_space, capacity=LOCATION_CACHE_SIZE, ttl=LOCATION_CACHE_TTL, clock=time.monotonic):
+        self.id_space = id_space
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.rights = []
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _contains(self, key_id, left, right):
+        # left == right is the arc of the only node of the ring, the whole ring
+        return left == right or self.id_space.between(key_id, left, right)
+
+    def _remove(self, right):
+        del self.entries[right]
+        del self.rights[bisect_left(self.rights, right)]
+
+    def get(self, key_id):
+        """
+        Returns the cached owner of key_id, or None.
+        """
+        with self.lock:
+            if self.rights:
+                right = self.rights[bisect_left(self.rights, key_id) % len(self.rights)]
+                left, node, expires = self.entries[right]
+                if self._contains(key_id, left, right):
+                    if expires <= self.clock():
+                        self._remove(right)
+                        self.expirations += 1
+                    else:
+                        self.entries.move_to_end(right)
+                        self.hits += 1
+                        return node
+            self.misses += 1
+            return None
+
+    def put(self, left, node):
+        """
+        Records that node owns the arc (left, node.node_id].
+        """
+        if self.capacity <= 0:
+            return
+        right = node.node_id
+        with self.lock:
+            if right in self.entries:
+                self.entries.move_to_end(right)
+            else:
+                insort(self.rights, right)
+                if len(self.rights) > self.capacity:
+                    self._remove(next(iter(self.entries)))
+                    self.evictions += 1
+            self.entries[right] = (left, node, self.clock() + self.ttl)
+
+    def invalidate(self, node_id):
+        """
+        Drops the arcs that contain node_id, including the arc owned by node_id.
+        Called when node_id joined or left the ring: a node that joined splits the arc it falls in, and the arcs of a
+        node that left are owned by its successor now. Membership changes are rare, so this is a plain scan.
+        """
+        with self.lock:
+            stale = [right for right, (left, _, _) in self.entries.items() if self._contains(node_id, left, right)]
+            for right in stale:
+                self._remove(right)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            del self.rights[:]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
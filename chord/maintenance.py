@@ -0,0 +1,75 @@
+import random
+import threading
+import time
+from enum import Enum
+from adhoccomputing.Generics import logger
+
+# Default periods in seconds of the background maintenance tasks
+STABILIZE_INTERVAL = 0.5
+FIX_FINGERS_INTERVAL = 0.1
+
+
+class FingerSelection(Enum):
+    ROUND_ROBIN = "ROUND_ROBIN"
+    RANDOM = "RANDOM"
+
+
+class StabilizationScheduler:
+    """
+    Runs the periodic maintenance of a single node on a background thread.
+
+    Every stabilize_interval seconds the node runs stabilize(), and every fix_fingers_interval seconds
+    it refreshes a single finger, chosen round robin or at random. Maintenance is spread over time
+    instead of rewriting every finger of every node whenever a node joins.
+    The work runs on its own thread because it issues lookups that wait for the node's worker threads.
+    """
+
+    def __init__(
+        self,
+        node,
+        stabilize_interval=STABILIZE_INTERVAL,
+        fix_fingers_interval=FIX_FINGERS_INTERVAL,
+        finger_selection=FingerSelection.ROUND_ROBIN,
+        seed=None,
+    ):
+        self.node = node
+        self.stabilize_interval = stabilize_interval
+        self.fix_fingers_interval = fix_fingers_interval
+        self.finger_selection = FingerSelection(finger_selection)
+        self.random = random.Random(seed)
+        self.next_finger = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def select_finger(self):
+        bits = self.node.id_space.bits
+        if self.finger_selection == FingerSelection.RANDOM:
+            return self.random.randrange(bits)
+        i = self.next_finger
+        self.next_finger = (i + 1) % bits
+        return i
+
+    def run(self):
+        now = time.monotonic()
+        next_stabilize = now + self.stabilize_interval
+        next_fix_finger = now + self.fix_fingers_interval
+        while not self.stopped.wait(max(0, min(next_stabilize, next_fix_finger) - time.monotonic())):
+            now = time.monotonic()
+            try:
+                if now >= next_stabilize:
+                    next_stabilize = now + self.stabilize_interval
+                    self.node.stabilize()
+                if now >= next_fix_finger:
+                    next_fix_finger = now + self.fix_fingers_interval
+                    self.node.fix_finger(self.select_finger())
+            except Exception as e:
+                logger.error(f"Maintenance of {self.node} failed: {e}")
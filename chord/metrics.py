@@ -0,0 +1,217 @@
+import csv
+import json
+import math
+import statistics
+import threading
+from collections import Counter
+
+
+class LatencyHistogram:
+    """
+    A log-bucketed histogram of latencies in seconds.
+
+    Bucket boundaries grow geometrically by growth from min_value, so recording a sample is a single
+    logarithm and a dict update, and percentiles are accurate to within one bucket (about 5% by default).
+    """
+
+    def __init__(self, min_value=1e-6, growth=1.05):
+        self.min_value = min_value
+        self.growth = growth
+        self.log_growth = math.log(growth)
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+
+    def bucket_of(self, value):
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self.log_growth) + 1
+
+    def upper_bound(self, bucket):
+        return self.min_value * self.growth**bucket
+
+    def record(self, value):
+        self.buckets[self.bucket_of(value)] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, p):
+        """
+        Returns the upper bound of the bucket holding the p-th percentile, p between 0 and 100.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return self.upper_bound(bucket)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+
+class NodeMetrics:
+    """
+    Routing metrics of a single node.
+
+    Counters, the hop counts of the lookups the node originated and their latencies are updated
+    under a per-node lock, so they stay correct with many worker threads and concurrent lookups.
+    simulated_latency holds the latencies the lookups would have had on the links of the latency model, if there is one.
+    """
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.hops = Counter()
+        self.latency = LatencyHistogram()
+        self.simulated_latency = LatencyHistogram()
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def record_lookup(self, hops, latency, simulated_latency=None):
+        with self.lock:
+            self.hops[hops] += 1
+            self.latency.record(latency)
+            if simulated_latency is not None:
+                self.simulated_latency.record(simulated_latency)
+
+    def reset(self):
+        with self.lock:
+            self.counters = Counter()
+            self.hops = Counter()
+            self.latency = LatencyHistogram()
+            self.simulated_latency = LatencyHistogram()
+
+    def snapshot(self):
+        with self.lock:
+            lookups = sum(self.hops.values())
+            return {
+                "node_id": self.node_id,
+                "counters": dict(self.counters),
+                "lookups": lookups,
+                "mean_hops": sum(h * n for h, n in self.hops.items()) / lookups if lookups else None,
+                "hops": dict(self.hops),
+                "latency": self.latency.summary(),
+                "simulated_latency": self.simulated_latency.summary(),
+            }
+
+
+def hop_percentile(hops, p):
+    """
+    Returns the p-th percentile of a Counter mapping hop counts to the number of lookups that took them.
+    """
+    total = sum(hops.values())
+    if total == 0:
+        return None
+    rank = max(1, math.ceil(total * p / 100))
+    seen = 0
+    for h in sorted(hops):
+        seen += hops[h]
+        if seen >= rank:
+            return h
+
+
+def collect(nodes):
+    """
+    Aggregates the metrics of the given nodes into a dict with a per-node breakdown and ring-wide totals.
+    """
+    counters = Counter()
+    hops = Counter()
+    latency = LatencyHistogram()
+    simulated_latency = LatencyHistogram()
+    cache = Counter()
+    per_node = []
+    for node in nodes:
+        metrics = node.metrics
+        with metrics.lock:
+            counters.update(metrics.counters)
+            hops.update(metrics.hops)
+            latency.merge(metrics.latency)
+            simulated_latency.merge(metrics.simulated_latency)
+        per_node.append(metrics.snapshot())
+        if getattr(node, "location_cache", None) is not None:
+            stats = node.location_cache.stats()
+            cache.update({name: value for name, value in stats.items() if name != "hit_rate"})
+    lookups = sum(hops.values())
+    return {
+        "nodes": per_node,
+        "total": {
+            "counters": dict(counters),
+            "lookups": lookups,
+            "mean_hops": sum(h * n for h, n in hops.items()) / lookups if lookups else None,
+            "p50_hops": hop_percentile(hops, 50),
+            "p99_hops": hop_percentile(hops, 99),
+            "latency": latency.summary(),
+            "simulated_latency": simulated_latency.summary(),
+            "location_cache": dict(cache, hit_rate=cache["hits"] / (cache["hits"] + cache["misses"]) if cache["hits"] + cache["misses"] else None),
+        },
+    }
+
+
+def key_load(nodes):
+    """
+    Reports how evenly the keys are spread over the physical nodes, virtual nodes being counted with their host.
+    Returns the key count of every physical node by node_id, with their mean, variance, standard deviation
+    and the ratio of the largest count to the mean, which is 1.0 for a perfectly balanced ring.
+    """
+    hosts = {}
+    for node in nodes:
+        hosts[id(node.host)] = node.host
+    counts = {host.node_id: len(host.store) for host in hosts.values()}
+    if not counts:
+        return {"nodes": {}, "mean": None, "variance": None, "stddev": None, "max_to_mean": None}
+    mean = statistics.fmean(counts.values())
+    variance = statistics.pvariance(counts.values(), mu=mean)
+    return {
+        "nodes": counts,
+        "mean": mean,
+        "variance": variance,
+        "stddev": math.sqrt(variance),
+        "max_to_mean": max(counts.values()) / mean if mean else None,
+    }
+
+
+def to_json(report, fp=None):
+    """
+    Serialises a report returned by collect, to fp if it is given, otherwise to a string.
+    """
+    if fp is not None:
+        json.dump(report, fp, indent=2)
+        return None
+    return json.dumps(report, indent=2)
+
+
+def to_csv(report, fp):
+    """
+    Writes one row per node of a report returned by collect.
+    """
+    counter_names = sorted({name for node in report["nodes"] for name in node["counters"]})
+    writer = csv.writer(fp)
+    writer.writerow(["node_id", *counter_names, "lookups", "mean_hops", "p50_latency", "p99_latency"])
+    for node in report["nodes"]:
+        writer.writerow([
+            node["node_id"],
+            *(node["counters"].get(name, 0) for name in counter_names),
+            node["lookups"],
+            node["mean_hops"],
+            node["latency"]["p50"],
+            node["latency"]["p99"],
+        ])
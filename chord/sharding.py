@@ -0,0 +1,530 @@
+"""
+Sharded ChordComponent rings that span several processes.
+
+A single process runs every node under one global interpreter lock. ShardedRing splits a ring across a pool of
+processes instead: the sorted node identifiers are cut into contiguous arcs and every process (a Shard) hosts the
+nodes of one arc. Nodes of other shards are represented by RemoteNode stubs, so finger tables, successor lists and
+routing work unchanged. Messages to a RemoteNode are coalesced per destination shard, encoded with the binary wire
+format of wire.py, or pickled with node identifiers in place of node objects if the wire format does not cover them,
+and sent over that shard's multiprocessing queue. The coordinator builds the shards,
+starts the lookups, and merges the metrics every shard reports:
+
+    python chord/sharding.py --size 100000 --bits 32 --shards 8 --lookups 200000 --lookup-threads 16 --format csv
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from adhoccomputing.Generics import *
+from benchmark import random_node_ids, write_results
+from chord_component import ChordComponent, RoutingModes
+from coalescing import OutboundCoalescer, COALESCE_WINDOW, COALESCE_MAX_MESSAGES
+from component_registry import ComponentRegistry
+from metrics import LatencyHistogram, hop_percentile
+import vectorized
+from wire import WireFormat, BATCH_MAGIC
+
+# Requests wait for queues between processes, so they get more time than within one process
+SHARD_REQUEST_TIMEOUT = 2.0
+
+FIELDS = [
+    "size",
+    "bits",
+    "shards",
+    "routing_mode",
+    "build_seconds",
+    "lookups",
+    "wrong_lookups",
+    "failed_lookups",
+    "lookups_per_second",
+    "mean_hops",
+    "p50_hops",
+    "p99_hops",
+    "p50_latency",
+    "p99_latency",
+    "messages_sent",
+    "cross_shard_messages",
+    "cross_shard_share",
+    "messages_per_batch",
+]
+
+
+class RemoteNode:
+    """
+    Stands for a node hosted by another shard. It has the attributes a node reads from its peers,
+    and its trigger_event hands the event to the shard, which sends it to the hosting process.
+    Remote nodes are never seen to crash.
+    """
+    __slots__ = ("shard", "node_id")
+    componentname = "Node"
+    alive = True
+
+    def __init__(self, shard, node_id):
+        self.shard = shard
+        self.node_id = node_id
+
+    @property
+    def componentinstancenumber(self):
+        return self.node_id
+
+    @property
+    def host(self):
+        return self
+
+    def trigger_event(self, eventobj: Event):
+        self.shard.send_remote(self, eventobj)
+
+    def __repr__(self):
+        return f"RemoteNode({self.node_id}, shard={self.shard.shard_of(self.node_id)})"
+
+
+class ShardedChordComponent(ChordComponent):
+    """
+    A ChordComponent without worker threads of its own: messages for it are queued to its shard, whose workers
+    handle the messages of all the nodes of the shard. Other events are handled right away, like the events of a
+    VirtualChordComponent.
+    """
+
+    def __init__(self, shard, node_id, configuration_parameters=None):
+        self.shard = shard
+        super().__init__(
+            "Node",
+            node_id,
+            configuration_parameters=configuration_parameters,
+            num_worker_threads=0,
+        )
+
+    def trigger_event(self, eventobj: Event):
+        if eventobj.event == EventTypes.MFRP:
+            self.shard.inbox.put_nowait(eventobj)
+        else:
+            self.eventhandlers[eventobj.event](eventobj=eventobj)
+
+
+class ShardPickler(pickle.Pickler):
+    """
+    Pickles messages with nodes replaced by their identifiers, so no node object leaves its process.
+    """
+
+    def persistent_id(self, obj):
+        if isinstance(obj, (ChordComponent, RemoteNode)):
+            return obj.node_id
+        return None
+
+
+class ShardUnpickler(pickle.Unpickler):
+    """
+    Unpickles messages of a ShardPickler, resolving node identifiers to the nodes of the shard or to RemoteNodes.
+    """
+
+    def __init__(self, data, shard):
+        super().__init__(io.BytesIO(data))
+        self.shard = shard
+
+    def persistent_load(self, pid):
+        return self.shard.node(pid)
+
+
+class Shard:
+    """
+    The nodes of one contiguous arc of a sharded ring, hosted by one process.
+
+    node_ids are the sorted identifiers of the whole ring and first_ids the first identifier of every shard, which
+    tells the shard of any node with one bisection. inboxes are the multiprocessing queues of all shards. A receiver
+    thread decodes the batches arriving on this shard's inbox, and workers threads handle the messages for the nodes
+    of the shard, whether they came from another shard or from a node of this one.
+    """
+
+    def __init__(
+        self,
+        index,
+        node_ids,
+        first_ids,
+        inboxes,
+        bits,
+        configuration_parameters=None,
+        workers=1,
+        coalesce_window=COALESCE_WINDOW,
+    ):
+        self.index = index
+        self.node_ids = node_ids
+        self.first_ids = first_ids
+        self.inboxes = inboxes
+        self.bits = bits
+        self.params = dict(configuration_parameters or {})
+        self.params.setdefault("request_timeout", SHARD_REQUEST_TIMEOUT)
+        self.workers = workers
+        self.nodes = {}
+        self.remote_nodes = {}
+        self.inbox = queue.Queue()
+        self.wire = None
+        self.coalescer = None
+        if coalesce_window:
+            self.coalescer = OutboundCoalescer(
+                self._deliver,
+                window=coalesce_window,
+                max_messages=COALESCE_MAX_MESSAGES,
+                busy=lambda shard: not self.inboxes[shard].empty(),
+            )
+        self.lock = threading.Lock()
+        self.remote_messages = 0
+        self.remote_batches = 0
+        self.threads = []
+
+    def shard_of(self, node_id):
+        return bisect_right(self.first_ids, node_id) - 1
+
+    def arc(self):
+        """
+        The slice of node_ids hosted by this shard.
+        """
+        start = bisect_left(self.node_ids, self.first_ids[self.index])
+        if self.index + 1 < len(self.first_ids):
+            return slice(start, bisect_left(self.node_ids, self.first_ids[self.index + 1]))
+        return slice(start, len(self.node_ids))
+
+    def node(self, node_id):
+        """
+        The node with the given identifier: a node of this shard, or a RemoteNode for a node of another shard.
+        """
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.remote_nodes.get(node_id)
+            if node is None:
+                node = self.remote_nodes.setdefault(node_id, RemoteNode(self, node_id))
+        return node
+
+    def build(self):
+        """
+        Creates the nodes of the shard and fills their predecessors, successor lists and fingers from node_ids,
+        like bootstrap_ring does for a ring in one process.
+        """
+        registry = ComponentRegistry()
+        registry.clear()
+        id_space = registry.configure_id_space(self.bits)
+        registry.set_resolver(self.node)
+        self.wire = WireFormat(id_space)
+        arc = self.arc()
+        local_ids = self.node_ids[arc]
+        for node_id in local_ids:
+            node = ShardedChordComponent(self, node_id, configuration_parameters=self.params)
+            self.nodes[node_id] = node
+            registry.add_component(node)
+        n = len(self.node_ids)
+        if vectorized.AVAILABLE:
+            sorted_ids = vectorized.as_ids(self.node_ids, id_space)
+            targets = vectorized.finger_targets(sorted_ids[arc], id_space)
+            rows = sorted_ids[vectorized.successor_indices(sorted_ids, targets)].tolist()
+        else:
+            rows = (
+                [self.node_ids[bisect_left(self.node_ids, start) % n] for start in id_space.finger_starts(node_id)]
+                for node_id in local_ids
+            )
+        for i, (node_id, row) in enumerate(zip(local_ids, rows), start=arc.start):
+            node = self.nodes[node_id]
+            node.predecessor = self.node(self.node_ids[i - 1])
+            count = min(node.successor_list_size, n - 1)
+            node.successor_list = [self.node(self.node_ids[(i + k) % n]) for k in range(1, count + 1)] or [node]
+            node.finger_table.assign(row)
+        for node in self.nodes.values():
+            node.joined = True
+            node.start_maintenance()
+            node.refresh_connections()
+
+    def start(self):
+        self.threads = [threading.Thread(target=self.receive, daemon=True)]
+        self.threads += [threading.Thread(target=self.work, daemon=True) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        if self.coalescer is not None:
+            self.coalescer.stop()
+        self.inboxes[self.index].put(None)
+        for _ in range(self.workers):
+            self.inbox.put(None)
+        for thread in self.threads:
+            thread.join()
+        for node in self.nodes.values():
+            node.exit_process()
+
+    def work(self):
+        while True:
+            eventobj = self.inbox.get()
+            if eventobj is None:
+                return
+            try:
+                eventobj.eventcontent.header.messageto.on_message_from_peer(eventobj)
+            except Exception as e:
+                logger.error(f"Shard {self.index} failed to handle {eventobj.eventcontent.header.messagetype}: {e}")
+
+    def receive(self):
+        inbox = self.inboxes[self.index]
+        while True:
+            data = inbox.get()
+            if data is None:
+                return
+            if data[0] == BATCH_MAGIC:
+                for message in self.wire.decode_batch(data, self.node):
+                    self.inbox.put_nowait(Event(message.header.messagefrom, EventTypes.MFRP, message))
+            else:
+                for source, message in ShardUnpickler(data, self).load():
+                    self.inbox.put_nowait(Event(source, EventTypes.MFRP, message))
+
+    def send_remote(self, node, eventobj: Event):
+        shard = self.shard_of(node.node_id)
+        item = (eventobj.eventsource, eventobj.eventcontent)
+        if self.coalescer is not None:
+            self.coalescer.send(shard, item)
+        else:
+            self._deliver(shard, [item])
+
+    def _deliver(self, shard, items):
+        if all(source is message.header.messagefrom and self.wire.encodable(message) for source, message in items):
+            data = self.wire.encode_batch([message for _, message in items])
+        else:
+            buffer = io.BytesIO()
+            ShardPickler(buffer, pickle.HIGHEST_PROTOCOL).dump(items)
+            data = buffer.getvalue()
+        with self.lock:
+            self.remote_messages += len(items)
+            self.remote_batches += 1
+        self.inboxes[shard].put(data)
+
+    def run_lookups(self, lookups, threads, seed):
+        """
+        Looks up lookups random keys from random nodes of the shard on threads threads and checks every result
+        against node_ids. Returns the counts of wrong and failed lookups.
+        """
+        nodes = list(self.nodes.values())
+        counts = Counter()
+        lock = threading.Lock()
+
+        def run(share, seed):
+            rng = random.Random(seed)
+            local = Counter()
+            for _ in range(share):
+                key = rng.getrandbits(self.bits)
+                result = rng.choice(nodes).lookup(key)
+                if result is None:
+                    local["failed"] += 1
+                elif result.successor.node_id != self.node_ids[bisect_left(self.node_ids, key) % len(self.node_ids)]:
+                    local["wrong"] += 1
+            with lock:
+                counts.update(local)
+
+        rng = random.Random(seed)
+        shares = [lookups // threads + (1 if i < lookups % threads else 0) for i in range(threads)]
+        workers = [threading.Thread(target=run, args=(share, rng.getrandbits(32))) for share in shares]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return counts
+
+    def report(self):
+        """
+        The mergeable totals of the shard: counters, hop counts and latency histograms of its nodes and its
+        cross shard traffic.
+        """
+        counters = Counter()
+        hops = Counter()
+        latency = LatencyHistogram()
+        for node in self.nodes.values():
+            with node.metrics.lock:
+                counters.update(node.metrics.counters)
+                hops.update(node.metrics.hops)
+                latency.merge(node.metrics.latency)
+        counters["cross_shard_messages"] = self.remote_messages
+        counters["cross_shard_batches"] = self.remote_batches
+        return {"counters": counters, "hops": hops, "latency": latency}
+
+
+def run_shard(index, node_ids, first_ids, inboxes, control, results, bits, options):
+    """
+    The main function of a shard process: builds the shard, then follows the commands of the coordinator.
+    """
+    setAHCLogLevel(ERROR)
+    shard = Shard(index, node_ids, first_ids, inboxes, bits, **options)
+    started = time.perf_counter()
+    shard.build()
+    shard.start()
+    results.put(("ready", index, time.perf_counter() - started))
+    while True:
+        command, *args = control.get()
+        if command == "lookups":
+            results.put(("done", index, shard.run_lookups(*args)))
+        elif command == "stop":
+            shard.stop()
+            results.put(("report", index, shard.report()))
+            return
+
+
+class ShardedRing:
+    """
+    Coordinates a ring of size nodes in a bits wide identifier space split into shards processes.
+
+    configuration_parameters are passed to every node. workers is the number of message handling threads of every
+    shard, and coalesce_window the seconds messages to another shard may wait to be sent with others, None to send
+    each on its own.
+    """
+
+    def __init__(
+        self,
+        size,
+        bits,
+        shards=None,
+        configuration_parameters=None,
+        workers=1,
+        coalesce_window=COALESCE_WINDOW,
+        seed=0,
+    ):
+        if size > 2**bits:
+            raise ValueError(f"A {bits} bit identifier space cannot hold {size} nodes")
+        self.size = size
+        self.bits = bits
+        self.shards = min(shards or os.cpu_count() or 1, size)
+        self.params = dict(configuration_parameters or {})
+        self.options = {
+            "configuration_parameters": self.params,
+            "workers": workers,
+            "coalesce_window": coalesce_window,
+        }
+        self.random = random.Random(seed)
+        ids = random_node_ids(self.random, size, bits)
+        self.node_ids = array("Q", ids) if bits <= 64 else ids
+        self.first_ids = [self.node_ids[i * size // self.shards] for i in range(self.shards)]
+        # The first shard also takes the identifiers below the first node, which wrap around to its arc
+        self.first_ids[0] = 0
+        self.processes = []
+
+    def _collect(self, results, kind):
+        replies = {}
+        while len(replies) < self.shards:
+            try:
+                reply_kind, index, value = results.get(timeout=1.0)
+            except queue.Empty:
+                failed = [process.name for process in self.processes if process.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"Shard processes {', '.join(failed)} failed")
+                continue
+            if reply_kind != kind:
+                raise RuntimeError(f"Shard {index} sent {reply_kind} while {kind} was expected")
+            replies[index] = value
+        return [replies[index] for index in range(self.shards)]
+
+    def run(self, lookups, lookup_threads=4):
+        """
+        Builds the shards, runs lookups lookups spread evenly over the shards and returns the merged measurements.
+        """
+        context = multiprocessing.get_context()
+        inboxes = [context.Queue() for _ in range(self.shards)]
+        controls = [context.Queue() for _ in range(self.shards)]
+        results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=run_shard,
+                args=(index, self.node_ids, self.first_ids, inboxes, controls[index], results, self.bits, self.options),
+                daemon=True,
+            )
+            for index in range(self.shards)
+        ]
+        for process in self.processes:
+            process.start()
+        try:
+            build_seconds = max(self._collect(results, "ready"))
+            started = time.perf_counter()
+            for index, control in enumerate(controls):
+                share = lookups // self.shards + (1 if index < lookups % self.shards else 0)
+                control.put(("lookups", share, lookup_threads, self.random.getrandbits(32)))
+            outcomes = self._collect(results, "done")
+            lookup_seconds = time.perf_counter() - started
+            for control in controls:
+                control.put(("stop",))
+            reports = self._collect(results, "report")
+        finally:
+            for process in self.processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+        return self._merge(lookups, build_seconds, lookup_seconds, outcomes, reports)
+
+    def _merge(self, lookups, build_seconds, lookup_seconds, outcomes, reports):
+        counts = Counter()
+        for outcome in outcomes:
+            counts.update(outcome)
+        counters = Counter()
+        hops = Counter()
+        latency = LatencyHistogram()
+        for report in reports:
+            counters.update(report["counters"])
+            hops.update(report["hops"])
+            latency.merge(report["latency"])
+        completed = sum(hops.values())
+        return {
+            "size": self.size,
+            "bits": self.bits,
+            "shards": self.shards,
+            "routing_mode": RoutingModes(self.params.get("routing_mode", RoutingModes.ITERATIVE)).value,
+            "build_seconds": build_seconds,
+            "lookups": lookups,
+            "wrong_lookups": counts["wrong"],
+            "failed_lookups": counts["failed"],
+            "lookups_per_second": lookups / lookup_seconds if lookup_seconds else None,
+            "mean_hops": sum(h * n for h, n in hops.items()) / completed if completed else None,
+            "p50_hops": hop_percentile(hops, 50),
+            "p99_hops": hop_percentile(hops, 99),
+            "p50_latency": latency.percentile(50),
+            "p99_latency": latency.percentile(99),
+            "messages_sent": counters["messages_sent"],
+            "cross_shard_messages": counters["cross_shard_messages"],
+            "cross_shard_share": counters["cross_shard_messages"] / counters["messages_sent"] if counters["messages_sent"] else None,
+            "messages_per_batch": counters["cross_shard_messages"] / counters["cross_shard_batches"] if counters["cross_shard_batches"] else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run lookups on a ChordComponent ring split across processes")
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--bits", type=int, default=32)
+    parser.add_argument("--shards", type=int, help="processes, one per CPU by default")
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--lookup-threads", type=int, default=4, help="lookup threads per shard")
+    parser.add_argument("--workers", type=int, default=1, help="message handling threads per shard")
+    parser.add_argument("--routing-mode", choices=[mode.value for mode in RoutingModes], default=RoutingModes.ITERATIVE.value)
+    parser.add_argument("--coalesce-window", type=float, default=COALESCE_WINDOW, help="seconds, 0 sends every message on its own")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", help="file to write the results to, standard output by default")
+    args = parser.parse_args(argv)
+
+    setAHCLogLevel(ERROR)
+    ring = ShardedRing(
+        args.size,
+        args.bits,
+        shards=args.shards,
+        configuration_parameters={"routing_mode": args.routing_mode},
+        workers=args.workers,
+        coalesce_window=args.coalesce_window,
+        seed=args.seed,
+    )
+    results = [ring.run(args.lookups, lookup_threads=args.lookup_threads)]
+    if args.output:
+        with open(args.output, "w", newline="") as fp:
+            write_results(results, fp, args.format, FIELDS)
+    else:
+        write_results(results, sys.stdout, args.format, FIELDS)
+
+
+if __name__ == "__main__":
+    main()
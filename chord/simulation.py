@@ -0,0 +1,376 @@
+"""
+Deterministic discrete-event simulation of ChordComponent rings.
+
+Nothing runs on threads or waits on the wall clock. A Simulator keeps a virtual clock and a priority queue of
+timestamped events: a message sent to a SimulatedChordComponent is handled when the clock reaches its send time
+plus the link delay, and a request that gets no answer fails when its timeout comes up in virtual time. Lookups
+are asynchronous and report their results to callbacks. With the same seed a run processes the same events in the
+same order, so its results are identical from run to run, and lookups are simulated as fast as the handlers run,
+for example:
+
+    python chord/simulation.py --size 1024 --bits 32 --lookups 100000 --rate 10000 --link-delay 0.01 --seed 1
+"""
+
+import argparse
+import heapq
+import itertools
+import random
+import sys
+import time
+from collections import Counter
+from adhoccomputing.Generics import *
+from benchmark import random_node_ids, write_results
+from chord_component import (
+    ApplicationLayerMessageTypes,
+    ChordComponent,
+    RoutingModes,
+    bootstrap_ring,
+)
+from component_registry import ComponentRegistry
+from latency import CoordinateLatency, LatencyModel
+from metrics import LatencyHistogram, hop_percentile
+
+# Default one way delay in seconds of links without a latency model, and the default request timeout of simulated
+# nodes: a recursive lookup is answered after its whole path, so it needs more than the in process default
+LINK_DELAY = 0.001
+SIMULATED_REQUEST_TIMEOUT = 2.0
+
+FIELDS = [
+    "size",
+    "bits",
+    "routing_mode",
+    "seed",
+    "lookups",
+    "successful_lookups",
+    "wrong_lookups",
+    "failed_lookups",
+    "crashes",
+    "mean_hops",
+    "p50_hops",
+    "p99_hops",
+    "mean_latency",
+    "p50_latency",
+    "p99_latency",
+    "messages_sent",
+    "timeouts",
+    "send_failures",
+    "events",
+    "simulated_seconds",
+    "wall_seconds",
+    "events_per_second",
+    "speedup",
+]
+
+
+class Simulator:
+    """
+    A discrete-event engine with a virtual clock.
+
+    Events are callbacks scheduled at a virtual time; run() pops them in time order, ties in the order they were
+    scheduled, and advances the clock to each one before calling it. Cancelled events are dropped when they come up. Link delays come from latency_model, or are
+    link_delay seconds on every link without one, plus a uniform random jitter of up to jitter seconds drawn from
+    the simulator's seeded random generator, which is also the one workloads should draw from.
+    """
+
+    def __init__(self, latency_model=None, link_delay=LINK_DELAY, jitter=0.0, seed=0):
+        self.latency_model = latency_model if latency_model is not None else LatencyModel(link_delay)
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.time = 0.0
+        self.queue = []
+        self.sequence = itertools.count()
+        self.events = 0
+
+    def clock(self):
+        return self.time
+
+    def schedule(self, delay, callback, *args):
+        """
+        Schedules callback(*args) delay seconds from now and returns the event, which cancel() takes.
+        """
+        event = [self.time + delay, next(self.sequence), callback, args]
+        heapq.heappush(self.queue, event)
+        return event
+
+    def cancel(self, event):
+        event[2] = None
+
+    def link_delay(self, source, destination):
+        delay = self.latency_model.latency(source.host.node_id, destination.host.node_id)
+        if self.jitter:
+            delay += self.random.uniform(0.0, self.jitter)
+        return delay
+
+    def run(self, until=None):
+        """
+        Processes events until there are none left, or until the next one is due after until.
+        Returns the number of events processed.
+        """
+        processed = 0
+        while self.queue and (until is None or self.queue[0][0] <= until):
+            at, _, callback, args = heapq.heappop(self.queue)
+            if callback is None:
+                continue
+            self.time = at
+            callback(*args)
+            processed += 1
+        if until is not None:
+            self.time = max(self.time, until)
+        self.events += processed
+        return processed
+
+
+class SimulatedChordComponent(ChordComponent):
+    """
+    A ChordComponent driven by a Simulator.
+
+    Messages to the node are scheduled link_delay after they are sent and handled when the simulator gets to them,
+    other events are handled right away. Suspicions and cached locations age with the virtual clock.
+    The blocking calls of ChordComponent would wait for answers that can only come from the simulator loop, so
+    the node is used through request() and lookup_async(), which take callbacks instead. Stabilization, joins,
+    leaves and message coalescing rely on blocking calls or threads and are not available.
+    """
+
+    def __init__(self, simulator, node_id, configuration_parameters=None):
+        self.simulator = simulator
+        self.clock = simulator.clock
+        super().__init__(
+            "Node",
+            node_id,
+            configuration_parameters=configuration_parameters,
+            num_worker_threads=0,
+        )
+
+    def trigger_event(self, eventobj: Event):
+        if eventobj.event == EventTypes.MFRP:
+            self.simulator.schedule(
+                self.simulator.link_delay(eventobj.eventsource, self), self.on_message_from_peer, eventobj
+            )
+        else:
+            self.eventhandlers[eventobj.event](eventobj=eventobj)
+
+    def request(self, node, message_type, payload, callback):
+        """
+        Sends a request and calls callback with its response, or with None when node refuses it or does not answer
+        within request_timeout seconds of virtual time. A node that crashed sends nothing, its requests fail.
+        """
+        request_id, req, future = self._new_request(node, message_type, payload)
+        future.add_done_callback(lambda done: callback(done.result()))
+        if not self.alive or not self.send_to(node, req):
+            self.resolve_request(request_id, None)
+            return
+        timer = self.simulator.schedule(self.request_timeout, self._expire, request_id, node)
+        future.add_done_callback(lambda done: self.simulator.cancel(timer))
+
+    def _expire(self, request_id, node):
+        self.metrics.increment("timeouts")
+        self.suspect(node)
+        self.resolve_request(request_id, None)
+
+    def lookup_async(self, node_id, callback, message_type=ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ):
+        """
+        Starts a lookup for node_id and calls callback with its LookupResult, or None, once it completes.
+        The route is the one of ChordComponent.lookup, see _lookup_walk, continued from the response callback of every
+        request. The latency recorded in the metrics is the virtual time the lookup took.
+        """
+        self.metrics.increment("lookups_started")
+        started = self.simulator.time
+        walk = self._lookup_walk(node_id, message_type)
+
+        def advance(response):
+            try:
+                request = walk.send(response)
+            except StopIteration as done:
+                self._record_lookup(done.value, self.simulator.time - started)
+                callback(done.value)
+                return
+            self.request(*request, advance)
+
+        advance(None)
+
+    def owner_async(self, key_id, callback, attempts=None):
+        """
+        Looks up the owner of key_id like owner_of: an owner that refuses the connection because it crashed is looked
+        up again around it. callback gets the LookupResult, or None.
+        """
+        attempts = self.successor_list_size + 1 if attempts is None else attempts
+
+        def found(result):
+            if result is not None and not self.contact(result.successor):
+                if attempts > 1:
+                    self.owner_async(key_id, callback, attempts - 1)
+                    return
+                result = None
+            callback(result)
+
+        self.lookup_async(key_id, found)
+
+
+class LookupSimulation:
+    """
+    Runs lookups lookups from random nodes of a ring of size nodes, arriving as a Poisson process of rate lookups
+    per second of virtual time, and checks every result against the registry. crashes random nodes crash at
+    random times while the lookups arrive. Every random choice is drawn from the simulator's generator.
+    """
+
+    def __init__(
+        self,
+        size=256,
+        bits=32,
+        lookups=10000,
+        rate=1000.0,
+        crashes=0,
+        routing_mode=RoutingModes.ITERATIVE,
+        link_delay=LINK_DELAY,
+        jitter=0.0,
+        latency_model=None,
+        configuration_parameters=None,
+        seed=0,
+    ):
+        if size > 2**bits:
+            raise ValueError(f"A {bits} bit identifier space cannot hold {size} nodes")
+        self.size = size
+        self.bits = bits
+        self.lookups = lookups
+        self.rate = rate
+        self.crashes = min(crashes, size - 1)
+        self.routing_mode = RoutingModes(routing_mode)
+        self.seed = seed
+        self.simulator = Simulator(latency_model, link_delay=link_delay, jitter=jitter, seed=seed)
+        self.params = dict(configuration_parameters or {}, routing_mode=self.routing_mode)
+        self.params.setdefault("request_timeout", SIMULATED_REQUEST_TIMEOUT)
+        self.registry = ComponentRegistry()
+        self.nodes = []
+        self.live = []
+        self.crashed = set()
+        self.outcomes = {"successful": 0, "wrong": 0, "failed": 0}
+
+    def build(self):
+        self.registry.clear()
+        self.registry.configure_id_space(self.bits)
+        self.registry.set_latency_model(self.simulator.latency_model)
+        self.nodes = [
+            SimulatedChordComponent(self.simulator, node_id, configuration_parameters=self.params)
+            for node_id in random_node_ids(self.simulator.random, self.size, self.bits)
+        ]
+        bootstrap_ring(self.nodes)
+        self.live = list(self.nodes)
+
+    def expected_owner(self, key):
+        # The first live node at or after key, crashed nodes stay in the registry
+        node = self.registry.successor_of(key)
+        while node.node_id in self.crashed:
+            node = self.registry.successor_of((node.node_id + 1) % self.registry.id_space.size)
+        return node
+
+    def start_lookup(self):
+        rng = self.simulator.random
+        key = rng.getrandbits(self.bits)
+        rng.choice(self.live).owner_async(key, lambda result: self.check(key, result))
+
+    def check(self, key, result):
+        if result is None:
+            self.outcomes["failed"] += 1
+        elif result.successor is not self.expected_owner(key):
+            self.outcomes["wrong"] += 1
+        else:
+            self.outcomes["successful"] += 1
+
+    def crash(self):
+        node = self.live.pop(self.simulator.random.randrange(len(self.live)))
+        self.crashed.add(node.node_id)
+        node.crash()
+
+    def run(self):
+        """
+        Builds the ring, simulates the workload to the end and returns the measurements.
+        """
+        started = time.perf_counter()
+        self.build()
+        rng = self.simulator.random
+        at = 0.0
+        for _ in range(self.lookups):
+            at += rng.expovariate(self.rate)
+            self.simulator.schedule(at, self.start_lookup)
+        for _ in range(self.crashes):
+            self.simulator.schedule(rng.uniform(0.0, at), self.crash)
+        self.simulator.run()
+        wall_seconds = time.perf_counter() - started
+        return self.report(wall_seconds)
+
+    def report(self, wall_seconds):
+        counters = Counter()
+        hops = Counter()
+        latency = LatencyHistogram()
+        for node in self.nodes:
+            counters.update(node.metrics.counters)
+            hops.update(node.metrics.hops)
+            latency.merge(node.metrics.latency)
+        completed = sum(hops.values())
+        simulated_seconds = self.simulator.time
+        return {
+            "size": self.size,
+            "bits": self.bits,
+            "routing_mode": self.routing_mode.value,
+            "seed": self.seed,
+            "lookups": self.lookups,
+            "successful_lookups": self.outcomes["successful"],
+            "wrong_lookups": self.outcomes["wrong"],
+            "failed_lookups": self.outcomes["failed"],
+            "crashes": self.crashes,
+            "mean_hops": sum(h * n for h, n in hops.items()) / completed if completed else None,
+            "p50_hops": hop_percentile(hops, 50),
+            "p99_hops": hop_percentile(hops, 99),
+            "mean_latency": latency.mean(),
+            "p50_latency": latency.percentile(50),
+            "p99_latency": latency.percentile(99),
+            "messages_sent": counters["messages_sent"],
+            "timeouts": counters["timeouts"],
+            "send_failures": counters["send_failures"],
+            "events": self.simulator.events,
+            "simulated_seconds": simulated_seconds,
+            "wall_seconds": wall_seconds,
+            "events_per_second": self.simulator.events / wall_seconds if wall_seconds else None,
+            "speedup": simulated_seconds / wall_seconds if wall_seconds else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate lookups on a ChordComponent ring in virtual time")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--bits", type=int, default=32)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=1000.0, help="lookups per simulated second")
+    parser.add_argument("--crashes", type=int, default=0, help="nodes that crash during the run")
+    parser.add_argument("--routing-mode", choices=[mode.value for mode in RoutingModes], default=RoutingModes.ITERATIVE.value)
+    parser.add_argument("--link-delay", type=float, default=LINK_DELAY, help="seconds per link without a latency model")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds of uniform random delay added per message")
+    parser.add_argument("--latency-model", choices=["none", "coordinates"], default="none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", help="file to write the results to, standard output by default")
+    args = parser.parse_args(argv)
+
+    setAHCLogLevel(ERROR)
+    simulation = LookupSimulation(
+        size=args.size,
+        bits=args.bits,
+        lookups=args.lookups,
+        rate=args.rate,
+        crashes=args.crashes,
+        routing_mode=args.routing_mode,
+        link_delay=args.link_delay,
+        jitter=args.jitter,
+        latency_model=CoordinateLatency(seed=args.seed) if args.latency_model == "coordinates" else None,
+        seed=args.seed,
+    )
+    results = [simulation.run()]
+    if args.output:
+        with open(args.output, "w", newline="") as fp:
+            write_results(results, fp, args.format, FIELDS)
+    else:
+        write_results(results, sys.stdout, args.format, FIELDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+
+
+def size_of(data):
+    """
+    Size in bytes of a stored key or value.
+    """
+    if isinstance(data, int):
+        return max(1, (data.bit_length() + 7) // 8)
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    return len(data)
+
+
+def as_value(value):
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    raise TypeError(f"Values must be bytes or str, got {type(value).__name__}")
+
+
+class KeyValueStore:
+    """
+    The key/value store of a node, ordered by ring position.
+
+    Keys are hashed onto the ring with the identifier space. The hashed identifiers are kept in a sorted list
+    next to a dict of buckets (keys that hash to the same identifier share a bucket), so single key operations
+    are O(log n) and the contiguous range of identifiers a node owns can be copied or split off with two bisections
+    and a slice, in O(log n + k) for k identifiers. The number of keys and the bytes of keys and values are kept
+    up to date on every change so reporting them is O(1).
+
+    The worker threads of a node and the threads writing through its API share the store, so changes hold a lock.
+    Single key reads do not: they only look up dicts, which is atomic.
+    """
+
+    def __init__(self, id_space):
+        self.id_space = id_space
+        self.lock = threading.RLock()
+        self.ids = []
+        self.buckets = {}
+        self.key_count = 0
+        self.bytes = 0
+
+    def __len__(self):
+        return self.key_count
+
+    def __contains__(self, key):
+        bucket = self.buckets.get(self.id_space.hash_key(key))
+        return bucket is not None and key in bucket
+
+    def __repr__(self):
+        return f"KeyValueStore(keys={self.key_count}, bytes={self.bytes})"
+
+    def put(self, key, value):
+        value = as_value(value)
+        key_id = self.id_space.hash_key(key)
+        with self.lock:
+            bucket = self.buckets.get(key_id)
+            if bucket is None:
+                bucket = self.buckets[key_id] = {}
+                insort(self.ids, key_id)
+            old = bucket.get(key)
+            if old is None:
+                self.key_count += 1
+                self.bytes += size_of(key)
+            else:
+                self.bytes -= len(old)
+            bucket[key] = value
+            self.bytes += len(value)
+            return key_id
+
+    def get(self, key, default=None):
+        bucket = self.buckets.get(self.id_space.hash_key(key))
+        if bucket is None:
+            return default
+        return bucket.get(key, default)
+
+    def delete(self, key):
+        key_id = self.id_space.hash_key(key)
+        with self.lock:
+            bucket = self.buckets.get(key_id)
+            if bucket is None or key not in bucket:
+                return False
+            value = bucket.pop(key)
+            self.key_count -= 1
+            self.bytes -= size_of(key) + len(value)
+            if not bucket:
+                del self.buckets[key_id]
+                del self.ids[bisect_left(self.ids, key_id)]
+            return True
+
+    def items(self):
+        for key_id in self.ids:
+            yield from self.buckets[key_id].items()
+
+    def _range_slices(self, left, right):
+        """
+        Index slices of self.ids covering the ring interval (left, right], two of them when the interval wraps around zero.
+        """
+        if left == right:
+            # The whole ring
+            return [slice(0, len(self.ids))]
+        lo = bisect_right(self.ids, left)
+        hi = bisect_right(self.ids, right)
+        if left < right:
+            return [slice(lo, hi)]
+        return [slice(lo, len(self.ids)), slice(0, hi)]
+
+    def range(self, left, right):
+        """
+        Returns the (key, value) pairs whose identifiers lie in (left, right] without removing them.
+        """
+        with self.lock:
+            items = []
+            for part in self._range_slices(left, right):
+                for key_id in self.ids[part]:
+                    items.extend(self.buckets[key_id].items())
+            return items
+
+    def copy_range(self, left, right):
+        """
+        Returns the identifiers in (left, right] as a new KeyValueStore without removing them.
+        """
+        with self.lock:
+            copy = KeyValueStore(self.id_space)
+            for part in sorted(self._range_slices(left, right), key=lambda part: part.start):
+                copy.ids.extend(self.ids[part])
+            for key_id in copy.ids:
+                bucket = copy.buckets[key_id] = dict(self.buckets[key_id])
+                for key, value in bucket.items():
+                    copy.key_count += 1
+                    copy.bytes += size_of(key) + len(value)
+            return copy
+
+    def split_range(self, left, right):
+        """
+        Removes the identifiers in (left, right] and returns them as a new KeyValueStore.
+        """
+        with self.lock:
+            split = KeyValueStore(self.id_space)
+            parts = self._range_slices(left, right)
+            # Slices come in ring order, the identifiers of the split store are kept in numeric order
+            for part in sorted(parts, key=lambda part: part.start):
+                split.ids.extend(self.ids[part])
+            # Delete the later slice first so the indices of the earlier one stay valid
+            for part in sorted(parts, key=lambda part: part.start, reverse=True):
+                del self.ids[part]
+            for key_id in split.ids:
+                bucket = self.buckets.pop(key_id)
+                split.buckets[key_id] = bucket
+                for key, value in bucket.items():
+                    split.key_count += 1
+                    split.bytes += size_of(key) + len(value)
+            self.key_count -= split.key_count
+            self.bytes -= split.bytes
+            return split
+
+    def merge(self, other):
+        """
+        Adds every entry of another KeyValueStore to this one, in O(n + k) when their identifiers do not overlap.
+        """
+        with self.lock:
+            new_ids = []
+            for key_id in other.ids:
+                bucket = other.buckets[key_id]
+                if key_id in self.buckets:
+                    for key, value in bucket.items():
+                        self.put(key, value)
+                    continue
+                self.buckets[key_id] = dict(bucket)
+                new_ids.append(key_id)
+                for key, value in bucket.items():
+                    self.key_count += 1
+                    self.bytes += size_of(key) + len(value)
+            if new_ids:
+                self.ids = list(merge(self.ids, new_ids))
@@ -0,0 +1,73 @@
+"""
+NumPy versions of the ring arithmetic, evaluated over arrays of identifiers at once.
+
+NumPy is optional: callers check AVAILABLE and fall back to the scalar code in identifier_space when it is missing.
+Identifier spaces of up to 62 bits use int64 arrays, so that adding a finger offset to an identifier cannot overflow.
+Wider spaces use object arrays of Python integers, which give the same results without the speed up.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+INT64_BITS = 62
+
+
+def dtype_for(id_space):
+    return np.int64 if id_space.bits <= INT64_BITS else object
+
+
+def as_ids(values, id_space):
+    return np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=dtype_for(id_space))
+
+
+def between(ids, left, right, ring_sz, inclusive_left=False, inclusive_right=True):
+    """
+    Vectorized identifier_space.between: ids, left and right are arrays (or scalars) broadcast against each other.
+    They are converted to the dtype of the ring first, so that wide rings never wrap around int64.
+    """
+    dtype = np.int64 if ring_sz <= 2**INT64_BITS else object
+    ids, left, right = np.broadcast_arrays(
+        np.asarray(ids, dtype=dtype), np.asarray(left, dtype=dtype), np.asarray(right, dtype=dtype)
+    )
+    distinct = left != right
+    if inclusive_left:
+        left = np.where(distinct, (left - 1 + ring_sz) % ring_sz, left)
+    if inclusive_right:
+        right = np.where(distinct, (right + 1) % ring_sz, right)
+    inside = (left < ids) & (ids < right)
+    outside = (ids > np.maximum(left, right)) | (ids < np.minimum(left, right))
+    return np.where(left < right, inside, outside).astype(bool)
+
+
+def finger_targets(node_ids, id_space):
+    """
+    Returns the (len(node_ids), bits) array of finger starts (node_id + 2^i) mod 2^m of all nodes.
+    """
+    node_ids = as_ids(node_ids, id_space)
+    offsets = as_ids(id_space.finger_offsets, id_space)
+    return (node_ids[:, None] + offsets[None, :]) % id_space.size
+
+
+def successor_indices(sorted_ids, targets):
+    """
+    Returns, for every target identifier, the index in sorted_ids of its successor on the ring.
+    """
+    return np.searchsorted(sorted_ids, targets, side="left") % len(sorted_ids)
+
+
+def closest_preceding_fingers(node_id, finger_ids, keys, id_space):
+    """
+    Answers closest_preceding_finger for a batch of keys at one node.
+
+    finger_ids holds the node identifiers of the node's fingers in finger order. Returns for each key the index
+    of the highest finger that lies strictly between node_id and the key, or -1 if no finger does.
+    """
+    keys = as_ids(keys, id_space)
+    fingers = as_ids(finger_ids, id_space)
+    precedes = between(fingers[None, :], node_id, keys[:, None], id_space.size, inclusive_left=False, inclusive_right=False)
+    # The highest preceding finger is the first hit when scanning the fingers backwards
+    reversed_hit = np.argmax(precedes[:, ::-1], axis=1)
+    return np.where(precedes.any(axis=1), len(fingers) - 1 - reversed_hit, -1)
@@ -0,0 +1,314 @@
+"""
+A compact binary wire format for chord messages.
+
+Within one process messages carry node objects. To cross a process boundary or a socket they are encoded with
+WireFormat instead: every node is written as its identifier and every field has a fixed place, so encoding is a few
+struct.pack_into calls into one preallocated buffer and decoding a few struct.unpack_from calls over a memoryview of
+the received bytes, without pickling and without intermediate copies. Decoding resolves identifiers back to nodes
+through a resolver, ComponentRegistry.get_node by default.
+
+Every message starts with the same header:
+
+    type (u8) | flags (u8) | hops (u16) | request_id (u64) | source | destination | target
+
+followed by a body that depends on the message type. type is a fixed code from TYPE_CODES, so new members of
+ApplicationLayerMessageTypes do not change the encoding of the existing ones. Identifiers are u64 in identifier spaces
+of up to 64 bits and fixed width big endian byte strings of ceil(bits / 8) bytes in wider ones. target is the lookup
+key of routing requests and the node a message is about otherwise, e.g. the successor of a routing response or the
+node of a NOTIFY.
+
+Routing messages, NOTIFY, UPDATE_FINGER_TABLE and the neighbour and pointer messages of stabilization and joins
+are encoded. Messages that carry keys and values, such as KEY_TRANSFER_REQ, are not: encodable tells them apart.
+"""
+
+import struct
+from adhoccomputing.Generics import GenericMessage
+from chord_component import (
+    ApplicationLayerMessageHeader,
+    ApplicationLayerMessageTypes,
+    FingerUpdatePayload,
+    LookupPayload,
+    LookupResult,
+    NeighboursPayload,
+    NotifyPayload,
+    PointerPayload,
+)
+from component_registry import ComponentRegistry
+
+# First byte of an encoded batch, which tells it apart from a pickle
+BATCH_MAGIC = 0xC4
+
+# Header flags
+NO_REQUEST_ID = 0x01
+NO_TARGET = 0x02
+NO_NEXT_HOP = 0x04
+NO_EXPECTED = 0x08
+DEPARTED = 0x10
+
+# Body layouts
+EMPTY = 0
+LOOKUP_REQUEST = 1
+LOOKUP_RESPONSE = 2
+NODE = 3
+FINGER_UPDATE = 4
+POINTER = 5
+NEIGHBOURS = 6
+
+# The type byte of every encoded message type. The codes are part of the format: they do not follow the order of
+# ApplicationLayerMessageTypes, a code is never reused, and a new encoded message type gets the next free code.
+TYPE_CODES = {
+    ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ: 1,
+    ApplicationLayerMessageTypes.FIND_SUCCESSOR_RESP: 2,
+    ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ: 3,
+    ApplicationLayerMessageTypes.FIND_PREDECESSOR_RESP: 4,
+    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ: 5,
+    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_RESP: 6,
+    ApplicationLayerMessageTypes.NOTIFY: 7,
+    ApplicationLayerMessageTypes.UPDATE_FINGER_TABLE: 8,
+    ApplicationLayerMessageTypes.SET_PREDECESSOR_REQ: 9,
+    ApplicationLayerMessageTypes.SET_PREDECESSOR_RESP: 10,
+    ApplicationLayerMessageTypes.SET_SUCCESSOR_REQ: 11,
+    ApplicationLayerMessageTypes.SET_SUCCESSOR_RESP: 12,
+    ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ: 13,
+    ApplicationLayerMessageTypes.GET_NEIGHBOURS_RESP: 14,
+}
+MESSAGE_TYPES = {code: message_type for message_type, code in TYPE_CODES.items()}
+
+LAYOUTS = {
+    ApplicationLayerMessageTypes.FIND_SUCCESSOR_REQ: LOOKUP_REQUEST,
+    ApplicationLayerMessageTypes.FIND_PREDECESSOR_REQ: LOOKUP_REQUEST,
+    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_REQ: LOOKUP_REQUEST,
+    ApplicationLayerMessageTypes.FIND_SUCCESSOR_RESP: LOOKUP_RESPONSE,
+    ApplicationLayerMessageTypes.FIND_PREDECESSOR_RESP: LOOKUP_RESPONSE,
+    ApplicationLayerMessageTypes.FIND_CLOSEST_PRECEDING_FINGER_RESP: LOOKUP_RESPONSE,
+    ApplicationLayerMessageTypes.NOTIFY: NODE,
+    ApplicationLayerMessageTypes.UPDATE_FINGER_TABLE: FINGER_UPDATE,
+    ApplicationLayerMessageTypes.SET_PREDECESSOR_REQ: POINTER,
+    ApplicationLayerMessageTypes.SET_PREDECESSOR_RESP: POINTER,
+    ApplicationLayerMessageTypes.SET_SUCCESSOR_REQ: POINTER,
+    ApplicationLayerMessageTypes.SET_SUCCESSOR_RESP: POINTER,
+    ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ: EMPTY,
+    ApplicationLayerMessageTypes.GET_NEIGHBOURS_RESP: NEIGHBOURS,
+}
+
+BATCH_HEADER = struct.Struct("<BI")
+
+
+class WireFormat:
+    """
+    Encodes and decodes chord messages for the identifier space id_space.
+    """
+
+    def __init__(self, id_space):
+        self.id_space = id_space
+        self.wide = id_space.bits > 64
+        self.id_size = (id_space.bits + 7) // 8 if self.wide else 8
+        node_id = f"{self.id_size}s" if self.wide else "Q"
+        self.header = struct.Struct(f"<BBHQ{node_id}{node_id}{node_id}")
+        self.node_id = struct.Struct(f"<{node_id}")
+        # origin, latency, number of avoided identifiers, which follow
+        self.lookup_request = struct.Struct(f"<{node_id}dH")
+        # predecessor, next_hop, latency
+        self.lookup_response = struct.Struct(f"<{node_id}{node_id}d")
+        self.finger_index = struct.Struct("<H")
+        # number of successor list identifiers, which follow
+        self.count = struct.Struct("<H")
+
+    def _id(self, node_id):
+        return node_id.to_bytes(self.id_size, "big") if self.wide else node_id
+
+    def _node_id(self, value):
+        return int.from_bytes(value, "big") if self.wide else value
+
+    @staticmethod
+    def encodable(message):
+        return message.header.messagetype in LAYOUTS
+
+    def size(self, message):
+        """
+        The number of bytes message takes on the wire.
+        """
+        layout = LAYOUTS[message.header.messagetype]
+        payload = message.payload
+        size = self.header.size
+        if layout == LOOKUP_REQUEST:
+            size += self.lookup_request.size + len(payload.avoid) * self.node_id.size
+        elif layout == LOOKUP_RESPONSE:
+            size += self.lookup_response.size
+        elif layout == FINGER_UPDATE:
+            size += self.finger_index.size
+        elif layout == POINTER:
+            size += self.node_id.size
+        elif layout == NEIGHBOURS:
+            size += self.count.size + len(payload.successor_list) * self.node_id.size
+        return size
+
+    def encode_into(self, message, buffer, offset=0):
+        """
+        Writes message into buffer at offset and returns the offset right after it.
+        """
+        hdr = message.header
+        layout = LAYOUTS[hdr.messagetype]
+        payload = message.payload
+        flags = 0
+        hops = 0
+        target = None
+        if layout == LOOKUP_REQUEST:
+            hops = payload.hops
+            target = payload.key
+        elif layout == LOOKUP_RESPONSE:
+            hops = payload.hops
+            target = payload.successor.node_id
+            if payload.next_hop is None:
+                flags |= NO_NEXT_HOP
+        elif layout == NEIGHBOURS:
+            if payload.predecessor is not None:
+                target = payload.predecessor.node_id
+        elif layout != EMPTY and payload.node is not None:
+            target = payload.node.node_id
+        if target is None:
+            flags |= NO_TARGET
+        if hdr.request_id is None:
+            flags |= NO_REQUEST_ID
+        if layout == POINTER:
+            if payload.expected is None:
+                flags |= NO_EXPECTED
+            if payload.departed:
+                flags |= DEPARTED
+        self.header.pack_into(
+            buffer,
+            offset,
+            TYPE_CODES[hdr.messagetype],
+            flags,
+            hops,
+            0 if hdr.request_id is None else hdr.request_id,
+            self._id(hdr.messagefrom.node_id),
+            self._id(hdr.messageto.node_id),
+            self._id(0 if target is None else target),
+        )
+        offset += self.header.size
+        if layout == LOOKUP_REQUEST:
+            self.lookup_request.pack_into(
+                buffer, offset, self._id(payload.origin.node_id), payload.latency, len(payload.avoid)
+            )
+            offset += self.lookup_request.size
+            offset = self._pack_ids(payload.avoid, buffer, offset)
+        elif layout == LOOKUP_RESPONSE:
+            next_hop = 0 if payload.next_hop is None else payload.next_hop.node_id
+            self.lookup_response.pack_into(
+                buffer, offset, self._id(payload.predecessor.node_id), self._id(next_hop), payload.latency
+            )
+            offset += self.lookup_response.size
+        elif layout == FINGER_UPDATE:
+            self.finger_index.pack_into(buffer, offset, payload.index)
+            offset += self.finger_index.size
+        elif layout == POINTER:
+            expected = 0 if payload.expected is None else payload.expected.node_id
+            self.node_id.pack_into(buffer, offset, self._id(expected))
+            offset += self.node_id.size
+        elif layout == NEIGHBOURS:
+            self.count.pack_into(buffer, offset, len(payload.successor_list))
+            offset += self.count.size
+            offset = self._pack_ids((node.node_id for node in payload.successor_list), buffer, offset)
+        return offset
+
+    def _pack_ids(self, node_ids, buffer, offset):
+        for node_id in node_ids:
+            self.node_id.pack_into(buffer, offset, self._id(node_id))
+            offset += self.node_id.size
+        return offset
+
+    def _unpack_ids(self, count, buffer, offset):
+        size = self.node_id.size
+        node_ids = [self._node_id(self.node_id.unpack_from(buffer, offset + i * size)[0]) for i in range(count)]
+        return node_ids, offset + count * size
+
+    def decode_from(self, buffer, offset=0, resolve=None):
+        """
+        Reads the message at offset of buffer, a memoryview or any other bytes-like object, resolving identifiers
+        to nodes with resolve. Returns the message and the offset right after it.
+        """
+        if resolve is None:
+            resolve = ComponentRegistry().get_node
+        code, flags, hops, request_id, source, destination, target = self.header.unpack_from(buffer, offset)
+        offset += self.header.size
+        message_type = MESSAGE_TYPES.get(code)
+        if message_type is None:
+            raise ValueError(f"Unknown message type code {code}")
+        layout = LAYOUTS[message_type]
+        target = None if flags & NO_TARGET else self._node_id(target)
+        if layout == LOOKUP_REQUEST:
+            origin, latency, count = self.lookup_request.unpack_from(buffer, offset)
+            avoid, offset = self._unpack_ids(count, buffer, offset + self.lookup_request.size)
+            payload = LookupPayload(target, resolve(self._node_id(origin)), hops, frozenset(avoid), latency)
+        elif layout == LOOKUP_RESPONSE:
+            predecessor, next_hop, latency = self.lookup_response.unpack_from(buffer, offset)
+            offset += self.lookup_response.size
+            payload = LookupResult(
+                resolve(self._node_id(predecessor)),
+                resolve(target),
+                hops,
+                None if flags & NO_NEXT_HOP else resolve(self._node_id(next_hop)),
+                latency,
+            )
+        elif layout == NODE:
+            payload = NotifyPayload(resolve(target))
+        elif layout == FINGER_UPDATE:
+            (index,) = self.finger_index.unpack_from(buffer, offset)
+            offset += self.finger_index.size
+            payload = FingerUpdatePayload(resolve(target), index)
+        elif layout == POINTER:
+            (expected,) = self.node_id.unpack_from(buffer, offset)
+            offset += self.node_id.size
+            payload = PointerPayload(
+                None if target is None else resolve(target),
+                None if flags & NO_EXPECTED else resolve(self._node_id(expected)),
+                bool(flags & DEPARTED),
+            )
+        elif layout == NEIGHBOURS:
+            (count,) = self.count.unpack_from(buffer, offset)
+            successors, offset = self._unpack_ids(count, buffer, offset + self.count.size)
+            payload = NeighboursPayload(
+                None if target is None else resolve(target),
+                [resolve(node_id) for node_id in successors],
+            )
+        else:
+            payload = None
+        header = ApplicationLayerMessageHeader(
+            message_type,
+            resolve(self._node_id(source)),
+            resolve(self._node_id(destination)),
+            request_id=None if flags & NO_REQUEST_ID else request_id,
+        )
+        return GenericMessage(header, payload), offset
+
+    def encode(self, message):
+        buffer = bytearray(self.size(message))
+        self.encode_into(message, buffer)
+        return buffer
+
+    def decode(self, data, resolve=None):
+        return self.decode_from(memoryview(data), 0, resolve)[0]
+
+    def encode_batch(self, messages):
+        """
+        Encodes a list of messages into a single buffer, allocated once for all of them.
+        """
+        buffer = bytearray(BATCH_HEADER.size + sum(self.size(message) for message in messages))
+        BATCH_HEADER.pack_into(buffer, 0, BATCH_MAGIC, len(messages))
+        offset = BATCH_HEADER.size
+        for message in messages:
+            offset = self.encode_into(message, buffer, offset)
+        return buffer
+
+    def decode_batch(self, data, resolve=None):
+        view = memoryview(data)
+        magic, count = BATCH_HEADER.unpack_from(view, 0)
+        if magic != BATCH_MAGIC:
+            raise ValueError("Not an encoded batch of chord messages")
+        offset = BATCH_HEADER.size
+        messages = []
+        for _ in range(count):
+            message, offset = self.decode_from(view, offset, resolve)
+            messages.append(message)
+        return messages
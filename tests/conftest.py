@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The chord modules import each other by their flat names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chord"))
+
+
+class StubNode:
+    """
+    Stands for a ring node where a test only needs its identifier, such as a cached owner or the source of a message.
+    """
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+
+    def __repr__(self):
+        return f"StubNode({self.node_id})"
+
+
+@pytest.fixture
+def make_node():
+    return StubNode
@@ -0,0 +1,77 @@
+from identifier_space import IdentifierSpace
+from location_cache import LocationCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cache_of(capacity=8, ttl=10.0):
+    clock = Clock()
+    return LocationCache(IdentifierSpace(16), capacity=capacity, ttl=ttl, clock=clock), clock
+
+
+def test_get_finds_the_arc_of_a_key(make_node):
+    cache, _ = cache_of()
+    node = make_node(200)
+    cache.put(100, node)
+    assert cache.get(150) is node
+    assert cache.get(200) is node
+    assert cache.get(100) is None
+    assert cache.get(201) is None
+
+
+def test_arc_across_the_wrap(make_node):
+    cache, _ = cache_of()
+    node = make_node(10)
+    cache.put(65000, node)
+    assert cache.get(65535) is node
+    assert cache.get(0) is node
+    assert cache.get(5) is node
+    assert cache.get(64000) is None
+
+
+def test_least_recently_used_arc_is_evicted(make_node):
+    cache, _ = cache_of(capacity=2)
+    first, second, third = make_node(100), make_node(200), make_node(300)
+    cache.put(50, first)
+    cache.put(150, second)
+    # Using the first arc makes the second the least recently used one
+    assert cache.get(80) is first
+    cache.put(250, third)
+    assert len(cache) == 2
+    assert cache.get(180) is None
+    assert cache.get(80) is first
+    assert cache.get(280) is third
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(make_node):
+    cache, clock = cache_of(ttl=10.0)
+    node = make_node(200)
+    cache.put(100, node)
+    clock.now = 9.0
+    assert cache.get(150) is node
+    clock.now = 10.0
+    assert cache.get(150) is None
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate_drops_the_arcs_containing_a_node(make_node):
+    cache, _ = cache_of()
+    cache.put(100, make_node(200))
+    cache.put(200, make_node(300))
+    cache.put(65000, make_node(10))
+    # A node joining at 150 splits the first arc only
+    cache.invalidate(150)
+    assert cache.get(150) is None
+    assert cache.get(250).node_id == 300
+    # The owner of an arc leaving drops that arc
+    cache.invalidate(10)
+    assert cache.get(5) is None
+    assert cache.stats()["invalidations"] == 2
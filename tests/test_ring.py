@@ -0,0 +1,312 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from adhoccomputing.Generics import ConnectorTypes, EventTypes
+
+import chord_component
+from chord_component import ApplicationLayerMessageTypes, ChordComponent, RoutingModes, bootstrap_ring
+from component_registry import ComponentRegistry
+
+BITS = 16
+
+
+@pytest.fixture
+def new_node():
+    """
+    Creates ring nodes in an empty registry and stops their worker threads after the test.
+    """
+    registry = ComponentRegistry()
+    registry.clear()
+    registry.configure_id_space(BITS)
+    nodes = []
+
+    def new_node(node_id, num_worker_threads=1, **parameters):
+        node = ChordComponent(
+            "Node",
+            node_id,
+            configuration_parameters={"request_timeout": 1.0, **parameters},
+            num_worker_threads=num_worker_threads,
+        )
+        nodes.append(node)
+        return node
+
+    yield new_node
+    for node in nodes:
+        node.exit_process()
+    registry.clear()
+
+
+def ring_of(new_node, size, seed=1, build="bootstrap", **parameters):
+    """
+    A ring of size nodes built with bootstrap_ring, or by joining the nodes one after the other with build="join".
+    """
+    node_ids = random.Random(seed).sample(range(2**BITS), size)
+    nodes = [new_node(node_id, **parameters) for node_id in node_ids]
+    if build == "join":
+        for node in nodes:
+            node.join()
+    else:
+        bootstrap_ring(nodes)
+    return sorted(nodes, key=lambda node: node.node_id)
+
+
+def widest_arc(nodes):
+    """
+    Returns the node owning the widest arc of the ring and an identifier in the middle of that arc.
+    """
+    size = 2**BITS
+    node = max(nodes, key=lambda node: (node.node_id - node.predecessor.node_id) % size)
+    return node, (node.predecessor.node_id + (node.node_id - node.predecessor.node_id) % size // 2) % size
+
+
+def hold_messages(monkeypatch, node, count=None):
+    """
+    Makes node miss the first count messages sent to it, all of them if count is None. Returns the list the missed
+    messages are kept in, so a test can deliver them late.
+    """
+    held = []
+    trigger_event = node.trigger_event
+
+    def missing_trigger_event(eventobj):
+        if eventobj.event == EventTypes.MFRP and (count is None or len(held) < count):
+            held.append(eventobj)
+        else:
+            trigger_event(eventobj)
+
+    monkeypatch.setattr(node, "trigger_event", missing_trigger_event)
+    return held
+
+
+def data_of(count):
+    return {f"key {i}": f"value {i}".encode() for i in range(count)}
+
+
+def test_join_takes_over_the_keys_of_its_arc(new_node):
+    nodes = ring_of(new_node, 8)
+    data = data_of(300)
+    assert nodes[0].put_many(data) == []
+    successor, node_id = widest_arc(nodes)
+    arc = successor.store.range(successor.predecessor.node_id, node_id)
+    assert arc
+
+    joined = new_node(node_id)
+    report = joined.join()
+    assert report.keys == len(arc)
+    assert sorted(joined.store.items()) == sorted(arc)
+    for node in nodes + [joined]:
+        assert node.get_many(data) == data
+
+
+def test_slow_key_transfer_loses_no_keys(new_node, monkeypatch):
+    nodes = ring_of(new_node, 8, request_timeout=0.1)
+    data = data_of(300)
+    nodes[0].put_many(data)
+    successor, node_id = widest_arc(nodes)
+    copy_range = successor.store.copy_range
+
+    def slow_copy_range(left, right):
+        time.sleep(0.3)
+        return copy_range(left, right)
+
+    # The transfer takes longer than request_timeout, but within KEY_TRANSFER_TIMEOUT
+    monkeypatch.setattr(successor.store, "copy_range", slow_copy_range)
+    joined = new_node(node_id, request_timeout=0.1)
+    assert joined.join().keys > 0
+    for node in nodes + [joined]:
+        assert node.get_many(data) == data
+
+
+def test_unanswered_key_transfer_keeps_the_keys_at_the_successor(new_node, monkeypatch):
+    nodes = ring_of(new_node, 8)
+    data = data_of(300)
+    nodes[0].put_many(data)
+    successor, node_id = widest_arc(nodes)
+    before = sorted(successor.store.items())
+    copy_range = successor.store.copy_range
+
+    def slow_copy_range(left, right):
+        time.sleep(0.5)
+        return copy_range(left, right)
+
+    monkeypatch.setattr(successor.store, "copy_range", slow_copy_range)
+    monkeypatch.setattr(chord_component, "KEY_TRANSFER_TIMEOUT", 0.1)
+    joined = new_node(node_id)
+    assert joined.join().keys == 0
+    # The response arrives after the joining node gave up on it, and the successor still holds every key
+    time.sleep(0.6)
+    assert sorted(successor.store.items()) == before
+    assert sum(len(node.store) for node in nodes) == len(data)
+
+
+def test_stale_cached_owner_rejects_keys(new_node):
+    nodes = ring_of(new_node, 8, location_cache_size=16)
+    successor, node_id = widest_arc(nodes)
+    data = {key: value for key, value in data_of(300).items() if successor.accepts(successor.id_space.hash_key(key))}
+    # A node away from the arc caches its owner with the first put
+    client = next(node for node in nodes if node is not successor and node.successor() is not successor)
+    assert client.put_many(data) == []
+    assert client.get_many(data) == data
+    assert client.metrics.hops[1] >= len(data)
+
+    joined = new_node(node_id, location_cache_size=16)
+    joined.join()
+    moved = [key for key in data if joined.accepts(joined.id_space.hash_key(key))]
+    assert moved
+    assert client.get_many(data) == data
+    assert client.metrics.counters["location_cache_rejections"] == len(moved)
+    # The stale arc is forgotten, the new owners of the keys are cached again
+    assert client.put_many({key: b"new" for key in moved}) == []
+    assert client.metrics.counters["location_cache_rejections"] == len(moved)
+    assert sorted(key for key, _ in joined.store.items()) == sorted(moved)
+    assert all(joined.store.get(key) == b"new" for key in moved)
+
+
+def test_send_connects_on_demand_and_refresh_prunes(new_node):
+    nodes = ring_of(new_node, 16)
+    node = nodes[0]
+    stranger = next(other for other in nodes if other is not node and other not in node.routing_neighbours())
+    assert stranger not in node.peers
+    assert node.neighbours_of(stranger) is not None
+    assert stranger in node.peers
+    assert stranger in node.connectors[ConnectorTypes.PEER]
+    node.refresh_connections()
+    assert node.peers == node.routing_neighbours()
+    assert stranger not in node.connectors[ConnectorTypes.PEER]
+
+
+def test_responses_are_matched_to_their_requests(new_node):
+    nodes = ring_of(new_node, 8)
+    origin, others = nodes[0], nodes[1:]
+    responses = origin.send_requests(
+        [(node, ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ, None) for node in others]
+    )
+    assert [response.predecessor for response in responses] == [node.predecessor for node in others]
+    assert not origin.pending_requests
+
+
+def test_late_response_is_dropped(new_node, monkeypatch):
+    nodes = ring_of(new_node, 8, request_timeout=0.05)
+    origin, node = nodes[0], nodes[4]
+    held = hold_messages(monkeypatch, node, count=1)
+    assert origin.neighbours_of(node) is None
+    assert origin.metrics.counters["timeouts"] == 1
+    # The request arrives after the origin gave up on it, its response must not answer the next request
+    monkeypatch.undo()
+    node.trigger_event(held[0])
+    response = origin.send_request(node, ApplicationLayerMessageTypes.GET_NEIGHBOURS_REQ, None)
+    assert response.successor_list == node.successor_list
+    assert not origin.pending_requests
+
+
+@pytest.mark.parametrize("missed, answered", [(2, True), (3, False)])
+def test_requests_are_resent_until_they_are_answered(new_node, monkeypatch, missed, answered):
+    nodes = ring_of(new_node, 8, request_timeout=0.05, request_retries=2)
+    origin, node = nodes[0], nodes[4]
+    held = hold_messages(monkeypatch, node, count=missed)
+    response = origin.neighbours_of(node)
+    assert (response is not None) == answered
+    assert len(held) == missed
+    assert origin.metrics.counters["timeouts"] == missed
+    # A node that answers in the end is not suspected any more
+    assert origin.is_suspected(node.node_id) != answered
+
+
+@pytest.mark.parametrize("build", ["bootstrap", "join"])
+@pytest.mark.parametrize("routing_mode", list(RoutingModes))
+def test_find_successor_matches_the_registry(new_node, build, routing_mode):
+    nodes = ring_of(new_node, 12, build=build, routing_mode=routing_mode)
+    registry = ComponentRegistry()
+    rng = random.Random(2)
+    # Keys at and next to the node identifiers, where an off by one error would show, and random ones
+    keys = [node.node_id + offset for node in nodes for offset in (-1, 0, 1)] + [rng.getrandbits(BITS) for _ in range(100)]
+    for key in keys:
+        key %= 2**BITS
+        assert rng.choice(nodes).find_successor(key) is registry.successor_of(key)
+    for node in nodes:
+        assert node.successor() is registry.successor_of((node.node_id + 1) % 2**BITS)
+        assert node.predecessor is registry.predecessor_of(node.node_id)
+
+
+@pytest.mark.parametrize("routing_mode", list(RoutingModes))
+def test_lookups_route_around_crashed_nodes(new_node, routing_mode):
+    nodes = ring_of(new_node, 16, routing_mode=routing_mode)
+    # Two neighbours crash together, fewer than a successor list holds
+    crashed = {nodes[3], nodes[4], nodes[10]}
+    for node in crashed:
+        node.crash()
+    live = [node for node in nodes if node not in crashed]
+
+    def live_owner(key):
+        return next((node for node in live if node.node_id >= key), live[0])
+
+    rng = random.Random(3)
+    keys = [rng.getrandbits(BITS) for _ in range(100)] + [node.node_id for node in crashed]
+    for key in keys:
+        assert rng.choice(live).owner_of(key) is live_owner(key)
+    # Crashed nodes refuse the connection, so no lookup waits for a timeout
+    assert sum(node.metrics.counters["timeouts"] for node in live) == 0
+    assert all(node.metrics.counters["failed_lookups"] == 0 for node in live)
+    for node in live:
+        node.stabilize()
+    for node in live:
+        assert node.successor() is live_owner((node.node_id + 1) % 2**BITS)
+    for key in keys:
+        assert rng.choice(live).find_successor(key) is live_owner(key)
+
+
+@pytest.mark.parametrize("write_quorum, written", [(2, True), (3, False)])
+def test_put_fails_below_the_write_quorum(new_node, write_quorum, written):
+    nodes = ring_of(new_node, 3, replicas=2, write_quorum=write_quorum)
+    client, owner, crashed = nodes
+    # One of the three copies of a key of owner cannot be written
+    crashed.crash()
+    key = owner.node_id
+    assert client.put(key, b"value") == written
+    assert (client.put_many({key: b"value"}) == []) == written
+    assert (client.metrics.counters["quorum_failures"] == 0) == written
+    assert owner.store.get(key) == b"value"
+    assert client.get(key) == b"value"
+
+
+def test_put_copies_around_a_replica_that_does_not_answer(new_node, monkeypatch):
+    nodes = ring_of(new_node, 4, replicas=2, request_timeout=0.05)
+    client, owner, replica, last = nodes
+    hold_messages(monkeypatch, replica)
+    # Without write_quorum every copy of the replica set is needed: the second round copies the key to the live
+    # successor after the replica set, which is the client here
+    assert client.put(owner.node_id, b"value")
+    assert client.metrics.counters["timeouts"] == 1
+    assert last.replica_store.get(owner.node_id) == b"value"
+    assert client.replica_store.get(owner.node_id) == b"value"
+
+
+@pytest.mark.parametrize("routing_mode", list(RoutingModes))
+def test_nodes_with_several_worker_threads(new_node, routing_mode):
+    nodes = ring_of(new_node, 12, num_worker_threads=4, routing_mode=routing_mode)
+    registry = ComponentRegistry()
+    data = data_of(400)
+    shares = [dict(list(data.items())[i::8]) for i in range(8)]
+
+    def run(i):
+        rng = random.Random(i)
+        keys = [rng.getrandbits(BITS) for _ in range(50)]
+        wrong = [key for key in keys if rng.choice(nodes).find_successor(key) is not registry.successor_of(key)]
+        share = shares[i % len(shares)]
+        failed = nodes[i % len(nodes)].put_many(share)
+        return wrong, failed, nodes[-1 - i % len(nodes)].get_many(share) == share
+
+    # Every node handles the lookups, writes and reads of eight client threads with four workers
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(run, range(8)))
+    assert results == [([], [], True)] * 8
+    # A node joins while the clients keep going, and no key gets lost
+    with ThreadPoolExecutor(8) as executor:
+        results = executor.map(run, range(8, 16))
+        joined = new_node(random.Random(5).getrandbits(BITS), num_worker_threads=4, routing_mode=routing_mode)
+        joined.join()
+        # Lookups that ran before the join completed may end at the old owner, writes and reads must not fail
+        assert all(not failed and read for _, failed, read in results)
+    for node in nodes + [joined]:
+        assert node.get_many(data) == data
@@ -0,0 +1,27 @@
+import pytest
+
+from chord_component import RoutingModes
+from simulation import LookupSimulation
+
+# Fields measured on the wall clock, which differ from run to run
+WALL_CLOCK_FIELDS = ("wall_seconds", "events_per_second", "speedup")
+
+
+def report_of(**parameters):
+    report = LookupSimulation(size=64, bits=16, lookups=500, rate=1000.0, **parameters).run()
+    for field in WALL_CLOCK_FIELDS:
+        del report[field]
+    return report
+
+
+@pytest.mark.parametrize("routing_mode", list(RoutingModes))
+def test_same_seed_gives_the_same_report(routing_mode):
+    parameters = dict(routing_mode=routing_mode, crashes=8, jitter=0.002, seed=7)
+    first = report_of(**parameters)
+    assert first == report_of(**parameters)
+    assert first["lookups"] == first["successful_lookups"] + first["wrong_lookups"] + first["failed_lookups"]
+    assert first["timeouts"] > 0 or first["send_failures"] > 0
+
+
+def test_other_seed_gives_another_report():
+    assert report_of(seed=1) != report_of(seed=2)
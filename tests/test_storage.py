@@ -0,0 +1,79 @@
+import pytest
+
+from identifier_space import IdentifierSpace
+from storage import KeyValueStore, size_of
+
+# Integer keys are their own identifiers, so these lie on both sides of zero
+WRAP_KEYS = [65530, 65535, 0, 3]
+OTHER_KEYS = [100, 40000, 65000]
+
+
+def store_of(keys):
+    store = KeyValueStore(IdentifierSpace(16))
+    for key in keys:
+        store.put(key, f"value {key}")
+    return store
+
+
+def totals(store):
+    items = list(store.items())
+    return len(items), sum(size_of(key) + len(value) for key, value in items)
+
+
+def test_split_range_across_the_wrap():
+    store = store_of(WRAP_KEYS + OTHER_KEYS)
+    split = store.split_range(65000, 10)
+    assert sorted(key for key, _ in split.items()) == sorted(WRAP_KEYS)
+    assert sorted(key for key, _ in store.items()) == sorted(OTHER_KEYS)
+    # Both stores keep their identifiers in numeric order, and their counters match their contents
+    assert split.ids == sorted(split.ids) and store.ids == sorted(store.ids)
+    assert (len(split), split.bytes) == totals(split)
+    assert (len(store), store.bytes) == totals(store)
+    assert split.get(0) == b"value 0" and store.get(0) is None
+
+
+def test_range_across_the_wrap_keeps_the_keys():
+    store = store_of(WRAP_KEYS + OTHER_KEYS)
+    assert sorted(key for key, _ in store.range(65000, 10)) == sorted(WRAP_KEYS)
+    assert len(store) == len(WRAP_KEYS + OTHER_KEYS)
+
+
+def test_copy_range_across_the_wrap_keeps_the_keys():
+    store = store_of(WRAP_KEYS + OTHER_KEYS)
+    copy = store.copy_range(65000, 10)
+    assert sorted(key for key, _ in copy.items()) == sorted(WRAP_KEYS)
+    assert copy.ids == sorted(copy.ids)
+    assert (len(copy), copy.bytes) == totals(copy)
+    assert len(store) == len(WRAP_KEYS + OTHER_KEYS)
+    # The copy has buckets of its own
+    copy.delete(0)
+    assert store.get(0) == b"value 0"
+
+
+def test_split_range_of_the_whole_ring():
+    store = store_of(WRAP_KEYS + OTHER_KEYS)
+    split = store.split_range(100, 100)
+    assert len(split) == len(WRAP_KEYS + OTHER_KEYS)
+    assert len(store) == 0 and store.bytes == 0 and store.ids == []
+
+
+@pytest.mark.parametrize("left, right", [(65000, 10), (10, 65000), (3, 3)])
+def test_merge_restores_a_split(left, right):
+    store = store_of(WRAP_KEYS + OTHER_KEYS)
+    before = sorted(store.items())
+    bytes_before = store.bytes
+    store.merge(store.split_range(left, right))
+    assert sorted(store.items()) == before
+    assert store.ids == sorted(store.ids)
+    assert (len(store), store.bytes) == (len(before), bytes_before)
+
+
+def test_merge_overwrites_shared_keys():
+    store = store_of(WRAP_KEYS)
+    other = KeyValueStore(store.id_space)
+    other.put(0, b"new")
+    other.put(65000, b"added")
+    store.merge(other)
+    assert store.get(0) == b"new"
+    assert store.get(65000) == b"added"
+    assert (len(store), store.bytes) == totals(store)
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+import vectorized
+from identifier_space import IdentifierSpace
+
+pytestmark = pytest.mark.skipif(not vectorized.AVAILABLE, reason="NumPy is not installed")
+
+
+@pytest.mark.parametrize("bits", [7, 62, 63, 64, 65, 160])
+@pytest.mark.parametrize("inclusive_left, inclusive_right", [(False, True), (False, False), (True, True), (True, False)])
+def test_between_matches_scalar(bits, inclusive_left, inclusive_right):
+    id_space = IdentifierSpace(bits)
+    rng = random.Random(bits)
+    edges = [0, 1, id_space.size - 2, id_space.size - 1, 2**62 % id_space.size, (2**63 - 1) % id_space.size]
+    ids = edges + [rng.getrandbits(bits) for _ in range(64)]
+    for left in edges + [rng.getrandbits(bits) for _ in range(8)]:
+        for right in edges + [left] + [rng.getrandbits(bits) for _ in range(8)]:
+            result = vectorized.between(
+                vectorized.as_ids(ids, id_space), left, right, id_space.size, inclusive_left, inclusive_right
+            ).tolist()
+            expected = [id_space.between(_id, left, right, inclusive_left, inclusive_right) for _id in ids]
+            assert result == expected, (left, right)
+
+
+@pytest.mark.parametrize("bits", [7, 62, 63, 64, 65, 160])
+def test_closest_preceding_fingers_matches_scalar(bits):
+    id_space = IdentifierSpace(bits)
+    rng = random.Random(bits)
+    node_id = rng.getrandbits(bits)
+    finger_ids = sorted(rng.getrandbits(bits) for _ in range(bits))
+    keys = [rng.getrandbits(bits) for _ in range(64)] + [node_id, (node_id + 1) % id_space.size]
+    expected = []
+    for key in keys:
+        hits = [i for i, finger in enumerate(finger_ids) if id_space.between(finger, node_id, key, False, False)]
+        expected.append(hits[-1] if hits else -1)
+    assert vectorized.closest_preceding_fingers(node_id, finger_ids, keys, id_space).tolist() == expected
@@ -0,0 +1,135 @@
+import pickle
+import random
+
+import pytest
+from adhoccomputing.Generics import GenericMessage
+
+from chord_component import (
+    ApplicationLayerMessageHeader,
+    ApplicationLayerMessageTypes,
+    FingerUpdatePayload,
+    KeyRangePayload,
+    LookupPayload,
+    LookupResult,
+    NeighboursPayload,
+    NotifyPayload,
+    PointerPayload,
+)
+from identifier_space import IdentifierSpace
+from wire import NO_REQUEST_ID, WireFormat
+
+Types = ApplicationLayerMessageTypes
+
+
+@pytest.fixture
+def nodes_of(make_node):
+    def nodes_of(bits):
+        id_space = IdentifierSpace(bits)
+        rng = random.Random(bits)
+        node_ids = {0, id_space.size - 1} | {rng.getrandbits(bits) for _ in range(6)}
+        return id_space, {node_id: make_node(node_id) for node_id in node_ids}
+
+    return nodes_of
+
+
+def messages(id_space, nodes):
+    a, b, c, d = sorted(nodes.values(), key=lambda node: node.node_id)[-4:]
+    last = id_space.size - 1
+    return [
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.FIND_SUCCESSOR_REQ, a, b, request_id=2**40),
+            LookupPayload(last, c, 3, frozenset({d.node_id, 0}), 0.25),
+        ),
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.FIND_CLOSEST_PRECEDING_FINGER_RESP, a, b, request_id=7),
+            LookupResult(c, d, 2, None, 1.5),
+        ),
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.FIND_SUCCESSOR_RESP, a, b, request_id=0),
+            LookupResult(c, d, 2, a, 1.5),
+        ),
+        GenericMessage(ApplicationLayerMessageHeader(Types.NOTIFY, a, b), NotifyPayload(c)),
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.UPDATE_FINGER_TABLE, a, b), FingerUpdatePayload(c, id_space.bits - 1)
+        ),
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.SET_SUCCESSOR_REQ, a, b, request_id=3), PointerPayload(c, d, True)
+        ),
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.SET_PREDECESSOR_RESP, a, b, request_id=3), PointerPayload(None)
+        ),
+        GenericMessage(ApplicationLayerMessageHeader(Types.GET_NEIGHBOURS_REQ, a, b, request_id=4), None),
+        GenericMessage(
+            ApplicationLayerMessageHeader(Types.GET_NEIGHBOURS_RESP, a, b, request_id=4),
+            NeighboursPayload(None, [c, d, a]),
+        ),
+    ]
+
+
+def assert_same(message, decoded):
+    assert decoded.header.messagetype == message.header.messagetype
+    assert decoded.header.messagefrom is message.header.messagefrom
+    assert decoded.header.messageto is message.header.messageto
+    assert decoded.header.request_id == message.header.request_id
+    if message.payload is None:
+        assert decoded.payload is None
+    else:
+        assert type(decoded.payload) is type(message.payload)
+        assert vars(decoded.payload) == vars(message.payload)
+
+
+@pytest.mark.parametrize("bits", [16, 64, 160])
+def test_round_trip(bits, nodes_of):
+    id_space, nodes = nodes_of(bits)
+    wire = WireFormat(id_space)
+    for message in messages(id_space, nodes):
+        data = wire.encode(message)
+        assert len(data) == wire.size(message)
+        assert_same(message, wire.decode(bytes(data), nodes.get))
+
+
+@pytest.mark.parametrize("bits", [16, 64, 160])
+def test_batch_round_trip(bits, nodes_of):
+    id_space, nodes = nodes_of(bits)
+    wire = WireFormat(id_space)
+    batch = messages(id_space, nodes)
+    decoded = wire.decode_batch(bytes(wire.encode_batch(batch)), nodes.get)
+    assert len(decoded) == len(batch)
+    for message, result in zip(batch, decoded):
+        assert_same(message, result)
+
+
+def test_messages_with_keys_are_not_encodable(nodes_of):
+    id_space, nodes = nodes_of(16)
+    a, b = list(nodes.values())[:2]
+    message = GenericMessage(
+        ApplicationLayerMessageHeader(Types.KEY_TRANSFER_REQ, a, b, request_id=1), KeyRangePayload(1, 2)
+    )
+    assert not WireFormat.encodable(message)
+    assert WireFormat.encodable(messages(id_space, nodes)[0])
+
+
+def test_decode_batch_rejects_other_data():
+    with pytest.raises(ValueError):
+        WireFormat(IdentifierSpace(16)).decode_batch(pickle.dumps([1, 2, 3]))
+
+
+def test_type_codes_are_fixed(nodes_of):
+    id_space, nodes = nodes_of(16)
+    a, b = sorted(nodes.values(), key=lambda node: node.node_id)[:2]
+    data = WireFormat(id_space).encode(
+        GenericMessage(ApplicationLayerMessageHeader(Types.NOTIFY, a, b), NotifyPayload(b))
+    )
+    # NOTIFY is type 7 whatever its place in ApplicationLayerMessageTypes: type, flags, hops, request_id, then the
+    # source, destination and target identifiers
+    header = bytes([7, NO_REQUEST_ID, 0, 0]) + bytes(8)
+    assert data == header + a.node_id.to_bytes(8, "little") + 2 * b.node_id.to_bytes(8, "little")
+
+
+def test_decode_rejects_unknown_type_codes(nodes_of):
+    id_space, nodes = nodes_of(16)
+    wire = WireFormat(id_space)
+    data = wire.encode(messages(id_space, nodes)[3])
+    data[0] = 255
+    with pytest.raises(ValueError):
+        wire.decode(bytes(data), nodes.get)